@@ -0,0 +1,426 @@
+# Aid data exchange
+import json
+# Handle files, directories and pseudo-terminals
+import os
+# Handle threads of this process
+import threading
+# Handle sleeps, delays and timings
+import time
+# Handle the command line
+import argparse
+# Hold the configuration files of a run
+import tempfile
+# Remove the configuration files of a run
+import shutil
+# Pack and unpack Modbus frames
+import struct
+# Serve the Modbus TCP host and the HTTP server
+import SocketServer
+# Serve the HTTP server
+import BaseHTTPServer
+# Put the pseudo-terminal of the Modbus RTU bus into raw mode
+import tty
+# Wait on the pseudo-terminal of the Modbus RTU bus
+import select
+# Stand in for the MySQL server
+import sqlite3
+# Vary the simulated measurements from one read to the next
+import random
+
+import client
+import metrics
+import sinks
+
+# Number of cycles to run, unless the command line specifies one
+cycleCountDefault = 100
+# Number of simulated "ABB PVS800" Central Inverters, unless the command line specifies one
+inverterCountDefault = 1
+# Number of simulated "Statcon Energiaa SMB-096" Combiner interfaces, unless the command line specifies one
+combinerCountDefault = 2
+
+# A function to compute the checksum of a Modbus RTU frame
+def checksumRTU(frame):
+	checksum = 0xFFFF
+	for character in frame:
+		checksum ^= ord(character)
+		for bit in range(0, 8):
+			if checksum & 1:
+				checksum = (checksum >> 1) ^ 0xA001
+			else:
+				checksum >>= 1
+	return struct.pack('<H', checksum)
+
+# A class to count the transactions that a simulator serves, from the threads that serve them
+class counter(object):
+	# The constructor for the counter class
+	def __init__(self):
+		super(counter, self).__init__()
+		self.value = 0
+		self.lock = threading.Lock()
+	# A method to count one more
+	def add(self, amount=1):
+		with self.lock:
+			self.value += amount
+
+# A class to serve each connection to the simulated "ABB PVS800" Central Inverter
+class handlerPVS800(SocketServer.BaseRequestHandler):
+	# A method to answer every request to read holding registers on the connection, in order
+	def handle(self):
+		inbox = ''
+		while True:
+			data = self.request.recv(4096)
+			if not data:
+				return
+			inbox += data
+			while len(inbox) >= 12:
+				transactionId, protocolId, length, unitId, functionCode, registerAddress, registerCount = struct.unpack('>HHHBBHH', inbox[:12])
+				inbox = inbox[6 + length:]
+				registers = [self.server.registers.get(registerAddress + offset, 0) for offset in range(0, registerCount)]
+				self.request.sendall(struct.pack('>HHHBBB', transactionId, 0, 3 + 2 * registerCount, unitId, 3, 2 * registerCount) + struct.pack('>%dH' % registerCount, *registers))
+				self.server.transactions.add()
+
+# A class to simulate an "ABB PVS800" Central Inverter as a Modbus TCP host on a local port
+class simulatorPVS800(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+	# The constructor for the simulatorPVS800 class
+	def __init__(self):
+		SocketServer.TCPServer.__init__(self, ('127.0.0.1', 0), handlerPVS800)
+		# The register map of the inverter, with values that comply with the thresholds of the sample configuration
+		self.registers = {
+			106: 250,
+			109: 4500,
+			111: 5000,
+			112: 1,
+			113: 20,
+			117: 300,
+			118: 180,
+			119: 45,
+			120: 1,
+			124: 3600,
+			125: 1500,
+			126: 120,
+			127: 4,
+			128: 0,
+			129: 12,
+			130: 8,
+			133: 620
+		}
+		# Number of transactions served
+		self.transactions = counter()
+		self.port = self.server_address[1]
+		self.thread = threading.Thread(target=self.serve_forever)
+		self.thread.daemon = True
+		self.thread.start()
+	# A method to stop serving
+	def stop(self):
+		self.shutdown()
+		self.server_close()
+
+# A class to simulate one or more "Statcon Energiaa SMB-096" Combiner interfaces as Modbus RTU slaves on one pseudo-terminal
+class simulatorSMB096(threading.Thread):
+	# The constructor for the simulatorSMB096 class
+	def __init__(self, slaveAddresses):
+		super(simulatorSMB096, self).__init__()
+		self.daemon = True
+		# The slaves on the bus
+		self.slaveAddresses = set(slaveAddresses)
+		# The pseudo-terminal, whose slave end the hosts open as their port
+		self.master, self.slave = os.openpty()
+		tty.setraw(self.slave)
+		self.portName = os.ttyname(self.slave)
+		# Number of transactions served
+		self.transactions = counter()
+		# Flag to stop the thread
+		self.stopEvent = threading.Event()
+		self.start()
+	# A method to compose the registers of a slave: twelve string currents, the voltage, two statuses and the temperature
+	def registers(self, registerAddress, registerCount):
+		registers = [random.randint(500, 900) for index in range(0, 12)] + [random.randint(600, 700), 1, 1, random.randint(300, 450)]
+		return (registers + [0] * (registerAddress + registerCount))[registerAddress:registerAddress + registerCount]
+	# A method to answer every request to read holding registers that is addressed to one of the slaves
+	def run(self):
+		inbox = ''
+		while not self.stopEvent.is_set():
+			readable, writable, broken = select.select([self.master], [], [], 0.1)
+			if not readable:
+				# A silent interval ends whatever frame is incomplete
+				inbox = ''
+				continue
+			inbox += os.read(self.master, 256)
+			while len(inbox) >= 8:
+				frame, inbox = inbox[:8], inbox[8:]
+				if checksumRTU(frame[:6]) != frame[6:]:
+					inbox = ''
+					break
+				slaveAddress, functionCode, registerAddress, registerCount = struct.unpack('>BBHH', frame[:6])
+				if (slaveAddress not in self.slaveAddresses) or (functionCode != 3):
+					continue
+				response = struct.pack('>BBB', slaveAddress, 3, 2 * registerCount) + struct.pack('>%dH' % registerCount, *self.registers(registerAddress, registerCount))
+				os.write(self.master, response + checksumRTU(response))
+				self.transactions.add()
+	# A method to stop serving
+	def stop(self):
+		self.stopEvent.set()
+		self.join()
+		os.close(self.master)
+		os.close(self.slave)
+
+# A class to answer each request to the simulated HTTP server
+class handlerHTTP(BaseHTTPServer.BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+	# A method to accept a payload, and to require no data on-demand
+	def do_POST(self):
+		body = self.rfile.read(int(self.headers.getheader('Content-Length', 0)))
+		self.server.requests.add()
+		self.server.uploaded.add(len(self.requestline) + len(str(self.headers)) + len(body))
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', '2')
+		self.end_headers()
+		self.wfile.write('{}')
+	# A method to keep the output of the benchmark clean
+	def log_message(self, format, *arguments):
+		pass
+
+# A class to simulate an HTTP server that accepts energy data on a local port
+class simulatorHTTP(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+	# The constructor for the simulatorHTTP class
+	def __init__(self):
+		BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), handlerHTTP)
+		# Number of requests served, and bytes received
+		self.requests = counter()
+		self.uploaded = counter()
+		self.port = self.server_address[1]
+		self.thread = threading.Thread(target=self.serve_forever)
+		self.thread.daemon = True
+		self.thread.start()
+	# A method to stop serving
+	def stop(self):
+		self.shutdown()
+		self.server_close()
+
+# A class to stand in for the connection of the MySQL driver, writing into an SQLite database instead
+class connectionSQLite(object):
+	# The constructor for the connectionSQLite class
+	def __init__(self, filename):
+		super(connectionSQLite, self).__init__()
+		self.handle = sqlite3.connect(filename, check_same_thread=False)
+		# Number of rows written
+		self.rows = counter()
+	# A method to open a cursor that translates the placeholders of the MySQL driver
+	def cursor(self):
+		return cursorSQLite(self)
+	# A method to commit a transaction
+	def commit(self):
+		self.handle.commit()
+	# A method to close the connection
+	def close(self):
+		self.handle.close()
+
+# A class to stand in for the cursor of the MySQL driver
+class cursorSQLite(object):
+	# The constructor for the cursorSQLite class
+	def __init__(self, connection):
+		super(cursorSQLite, self).__init__()
+		self.connection = connection
+		self.handle = connection.handle.cursor()
+	# A method to run a statement for every row of a list, creating its table on first use
+	def executemany(self, statement, rows):
+		rows = list(rows)
+		table = statement.split('`')[1]
+		columns = statement[statement.index('(') + 1:statement.index(')')]
+		self.handle.execute('CREATE TABLE IF NOT EXISTS `' + table + '` (' + columns + ')')
+		self.handle.executemany(statement.replace('%s', '?').replace('False', '0'), rows)
+		self.connection.rows.add(len(rows))
+	# A method to close the cursor
+	def close(self):
+		self.handle.close()
+
+# A class to stand in for the MySQL driver, connecting every server to one SQLite database
+class driverSQLite(object):
+	Error = sqlite3.Error
+	OperationalError = sqlite3.OperationalError
+	# The constructor for the driverSQLite class
+	def __init__(self, filename):
+		super(driverSQLite, self).__init__()
+		self.connection = connectionSQLite(filename)
+	# A method to connect to the database, whatever the server
+	def connect(self, *arguments, **keywords):
+		return self.connection
+
+# A function to compose the hardware configuration of a run: every inverter on its own port, and every combiner on one bus
+def configureHardware(inverters, combiners, transport):
+	devices = []
+	for serialNumber, inverter in enumerate(inverters):
+		devices.append({
+			'type': 'inverter',
+			'serialNumber': str(serialNumber),
+			'manufacturer': 'ABB',
+			'modelNumber': 'PVS800',
+			'toStore': 'False',
+			'identity': {
+				'IPAddress': '127.0.0.1',
+				'port': str(inverter.port),
+				'transport': transport,
+				'threshold': {
+					'powerGrid': {'value': '6500', 'type': 'max'},
+					'currentPV': {'valueMax': '10000', 'valueMin': '0', 'type': 'pass'}
+				}
+			}
+		})
+	if combiners is not None:
+		for serialNumber, slaveAddress in enumerate(sorted(combiners.slaveAddresses)):
+			devices.append({
+				'type': 'combiner',
+				'serialNumber': str(serialNumber),
+				'manufacturer': 'Statcon Energiaa',
+				'modelNumber': 'SMB096',
+				'toStore': 'False',
+				'identity': {
+					'portName': combiners.portName,
+					'baudrate': '9600',
+					'slaveAddress': str(slaveAddress),
+					'threshold': dict(('current' + str(index), {'value': '0', 'type': 'min'}) for index in range(1, 13))
+				}
+			})
+	return {'devices': devices}
+
+# A function to compose the software configuration of a run: the first variables of the measurement set of the inverters, and of the combiners if any, despatched to the HTTP server or its stand-in
+def configureSoftware(variableCount, isCombined, serverHTTP, formatHTTP, directory, isMySQL):
+	measurementSets = {
+		'measurementSet0': ['currentGrid', 'powerGrid', 'frequencyGrid', 'pfGrid', 'reactivepowerGrid', 'voltagePV', 'currentPV', 'powerPV', 'temperatureInverter', 'modeInverter', 'uptimeInverter', 'electricityGeneration', 'kiloGeneration', 'megaGeneration', 'gigaGeneration', 'breakercountGrid', 'breakercountPV'],
+		'measurementSet1': ['current1', 'current2', 'current3', 'current4', 'current5', 'current6', 'current7', 'current8', 'current9', 'current10', 'current11', 'current12', 'voltage_DC', 'status_spd', 'status_switch', 'temperature_scb']
+	}
+	settings = {
+		'servers': {
+			'server0': {
+				'protocol': 'http',
+				'hostname': '127.0.0.1',
+				'portnumber': str(serverHTTP.port),
+				'path': '/write',
+				'pathBulk': '/write/bulk',
+				'username': '',
+				'password': '',
+				'certificate': '',
+				'format': formatHTTP
+			},
+			'server1': {
+				'protocol': 'mysql',
+				'hostname': '',
+				'portnumber': '',
+				'username': '',
+				'password': '',
+				'databasename': 'soreva'
+			}
+		},
+		'journal': {
+			'directory': os.path.join(directory, 'journal')
+		},
+		'measurementSets': {},
+		'combinations': {}
+	}
+	if not isCombined:
+		del measurementSets['measurementSet1']
+	for setName, variableNames in sorted(measurementSets.items()):
+		settings['measurementSets'][setName] = dict(('variable' + str(index), variableName) for index, variableName in enumerate(variableNames[:variableCount]))
+		settings['combinations']['combination' + str(len(settings['combinations']))] = {'server': 'server1' if isMySQL else 'server0', 'measurementSet': setName}
+	return settings
+
+# A function to report a percentile of a sorted list of samples, by the nearest rank
+def percentile(samples, fraction):
+	return samples[max(0, int(round(fraction * len(samples) + 0.5)) - 1)]
+
+# A function to merge the histograms of a metric across its labels, as the number of observations in each bucket, their bounds, and the sum and number of every observation
+def mergeHistograms(name):
+	merged = metrics.histogram()
+	with metrics.registry.lock:
+		for (each, labels), observed in metrics.registry.histograms.items():
+			if each == name:
+				merged.counts = [count + countObserved for count, countObserved in zip(merged.counts, observed.counts)]
+				merged.sum += observed.sum
+				merged.count += observed.count
+	return merged
+
+# A function to report a percentile of the observations in a histogram, as the upper bound of the bucket that holds it, or infinity beyond every bound
+def percentileHistogram(observed, fraction):
+	rank = max(1, int(round(fraction * observed.count + 0.5)))
+	cumulative = 0
+	for bound, count in zip(list(observed.buckets) + [float('inf')], observed.counts):
+		cumulative += count
+		if cumulative >= rank:
+			return bound
+	return float('inf')
+
+# A function to run a number of cycles against the simulators, and report their costs
+def run(cycleCount, inverterCount, combinerCount, variableCount, transport, formatHTTP, isMySQL):
+	directory = tempfile.mkdtemp()
+	inverters = [simulatorPVS800() for inverterIndex in range(0, inverterCount)]
+	combiners = simulatorSMB096(range(1, combinerCount + 1)) if combinerCount else None
+	serverHTTP = simulatorHTTP()
+	driver = driverSQLite(os.path.join(directory, 'soreva.db'))
+	sinks.MySQLdb = driver
+	try:
+		# Drive the client through its own configuration files
+		client.filenameH = os.path.join(directory, 'cH.json')
+		client.filenameS = os.path.join(directory, 'cS.json')
+		with open(client.filenameH, 'w') as filehandle:
+			json.dump(configureHardware(inverters, combiners, transport), filehandle)
+		with open(client.filenameS, 'w') as filehandle:
+			json.dump(configureSoftware(variableCount, combiners is not None, serverHTTP, formatHTTP, directory, isMySQL), filehandle)
+		cS, cH = client.setup()
+		latencies = []
+		timesCPU = []
+		for cycleIndex in range(0, cycleCount):
+			timeStart, timesStart = time.time(), os.times()
+			client.cycle(cS, cH, cS.setIndices.keys())
+			timeStop, timesStop = time.time(), os.times()
+			latencies.append(timeStop - timeStart)
+			timesCPU.append((timesStop[0] + timesStop[1]) - (timesStart[0] + timesStart[1]))
+		# Whatever remains in windows and batches counts towards the upload, once every despatch handed over to the servers has been made
+		timeStart = time.time()
+		client.closeWindows(cS, cH)
+		cS.wait()
+		timeDrained = time.time() - timeStart
+		cS.close()
+		cH.detach()
+		transactions = sum(inverter.transactions.value for inverter in inverters) + (combiners.transactions.value if combiners is not None else 0)
+		latencies.sort()
+		# A cycle only hands its despatches over to the threads of the servers, whose latency is observed apart
+		despatches = mergeHistograms('marshal_dispatch_seconds')
+		print 'Hosts: %d inverters, %d combiners; variables: %d per set; transport: %s; server: %s' % (inverterCount, combinerCount, variableCount, transport, 'mysql' if isMySQL else 'http ' + formatHTTP)
+		print 'Cycles:                   %d' % cycleCount
+		print 'Transactions per cycle:   %.1f' % (float(transactions) / cycleCount)
+		print 'Cycle latency p50:        %.2f ms' % (percentile(latencies, 0.50) * 1000.0)
+		print 'Cycle latency p99:        %.2f ms' % (percentile(latencies, 0.99) * 1000.0)
+		print 'CPU time per cycle:       %.2f ms' % (sum(timesCPU) / cycleCount * 1000.0)
+		print 'Despatches:               %d' % despatches.count
+		if despatches.count:
+			print 'Despatch latency mean:    %.2f ms' % (despatches.sum / despatches.count * 1000.0)
+			print 'Despatch latency p50:     <= %.2f ms' % (percentileHistogram(despatches, 0.50) * 1000.0)
+			print 'Despatch latency p99:     <= %.2f ms' % (percentileHistogram(despatches, 0.99) * 1000.0)
+		print 'Despatch drain at end:    %.2f ms' % (timeDrained * 1000.0)
+		print 'Requests per cycle:       %.1f' % (float(serverHTTP.requests.value) / cycleCount)
+		print 'Bytes uploaded per cycle: %.1f' % (float(serverHTTP.uploaded.value) / cycleCount)
+		print 'Rows written per cycle:   %.1f' % (float(driver.connection.rows.value) / cycleCount)
+	finally:
+		for inverter in inverters:
+			inverter.stop()
+		if combiners is not None:
+			combiners.stop()
+		serverHTTP.stop()
+		shutil.rmtree(directory)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Run cycles of acquisition and despatch against local simulators of the hosts and servers, and report their costs')
+	parser.add_argument('--cycles', type=int, default=cycleCountDefault, help='number of cycles to run')
+	parser.add_argument('--inverters', type=int, default=inverterCountDefault, help='number of simulated ABB PVS800 inverters, over Modbus TCP')
+	parser.add_argument('--combiners', type=int, default=combinerCountDefault, help='number of simulated Statcon Energiaa SMB-096 combiners, over Modbus RTU on one pseudo-terminal')
+	parser.add_argument('--variables', type=int, default=17, help='number of variables of each measurement set')
+	parser.add_argument('--transport', choices=['pyModbusTCP', 'pipelined'], default='pyModbusTCP', help='transport of the inverters')
+	parser.add_argument('--format', choices=['json', 'batch'], default='json', help='format of the HTTP server')
+	parser.add_argument('--mysql', action='store_true', help='despatch to a stand-in for the MySQL server, on SQLite, instead')
+	arguments = parser.parse_args()
+	run(arguments.cycles, arguments.inverters, arguments.combiners, arguments.variables, arguments.transport, arguments.format, arguments.mysql)
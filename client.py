@@ -1,45 +1,123 @@
+# Handle sleeps and delays, and time the imports, as reported in the startup profile
+import time
+timeImportStart = time.time()
 # Aid data exchange
 import json
 # Forks processes to retrieve parameter values through shell commands
 import os
 # Handle threads of this process
 import threading
-# Despatch HTTP requests as a client
-import requests
-# Handle communications with a MySQL database
-import MySQLdb
 # Generate timestamps
 import datetime
-# Handle timezones
-import pytz
-# Handle sleeps and delays
-import time
-# Handle output of executing python commands stored as strings in the dictionary
+# Stop the daemon cleanly on a signal
+import signal
+# Read the command line
 import sys
-# Handle output of executing python commands stored as strings in the dictionary
-import StringIO
-# Handle output of executing python commands stored as strings in the dictionary
-import contextlib
+# Represent compiled plans as immutable records
+import collections
 
 import common
 import equipment
+import journal
+import latest
+import metrics
+import profiles
+import sinks
+import windows
+import workers
+
+# The time, in seconds, taken to import the modules of the client
+importTime = time.time() - timeImportStart
+
+# Paths of the software and hardware configuration files
+filenameS = '/home/pi/marshal/cS.json'
+filenameH = '/home/pi/marshal/cH.json'
+# Interval between acquisitions, in seconds, for measurement sets that do not specify one
+intervalDefault = 60.0
+# Directory of the journals of payloads awaiting despatch, unless the software configuration specifies one
+directoryJournal = '/home/pi/marshal/journal'
+# Number of batches from the journal to replay at the end of a single cycle
+drainBatchCount = 10
+# Interval between payloads carrying every variable of a measurement set with deadbands, in seconds, unless the set specifies one
+heartbeatDefault = 900.0
+# Interval for which a prefetched on-demand variable holds, in seconds, unless the server specifies one
+prefetchTTLDefault = 5.0
+# Number of consecutive responses that must request an on-demand variable before it is prefetched, unless the server specifies one
+prefetchThresholdDefault = 2
+# Interval between checks of the configuration files for changes, in seconds
+reloadInterval = 5.0
 
+# Handle timezones, once a timestamp needs to
+pytz = None
+# Keep a compressed history of the samples, once the configuration names a directory for it
+historian = None
 # toDo: Read local timezone from the configuration file
-timezoneLocal = pytz.timezone('Asia/Calcutta')
+timezoneLocal = None
 
 def universal2local(timeUniversal):
+	global pytz, timezoneLocal
+	if pytz is None:
+		pytz = common.importLibrary('pytz')
+		timezoneLocal = pytz.timezone('Asia/Calcutta')
 	timeLocal = timeUniversal.replace(tzinfo=pytz.utc).astimezone(timezoneLocal)
 	return timezoneLocal.normalize(timeLocal).strftime('%Y-%m-%d %H:%M:%S.%f %Z%z')
 
-# Handle output of executing python commands stored as strings in the dictionary
-@contextlib.contextmanager
-def stdoutIO(stdout=None):
-	old = sys.stdout
-	if stdout is None:
-		stdout = StringIO.StringIO()
-	sys.stdout = stdout
-	yield stdout
-	sys.stdout = old
+# A function to list the values of the keys of a dictionary that consist of a prefix and a number, in the order of that number
+def listIndexed(dictionary, prefix):
+	entries = []
+	for key, value in dictionary.items():
+		if key.startswith(prefix) and key[len(prefix):].isdigit():
+			entries.append((int(key[len(prefix):]), value))
+	return [value for number, value in sorted(entries)]
+
+# A function to compile the deadband of each of a list of variables, as a flag indicating a percentage of the last value reported and the width of the band, or None for variables without one
+def compileDeadbands(variableNames, deadband):
+	deadbands = []
+	for variableName in variableNames:
+		if variableName in deadband:
+			deadbands.append((deadband[variableName]['type'] == 'percent', float(deadband[variableName]['value'])))
+		else:
+			deadbands.append(None)
+	return tuple(deadbands)
+
+# A function to check if a value has moved beyond its deadband since the value last reported, if any
+def isMoved(deadband, value, valueReported):
+	if valueReported is None:
+		return True
+	# Parameters are text, and move on any change
+	if not isinstance(value, (int, long, float)):
+		return value != valueReported
+	isPercent, width = deadband
+	if isPercent:
+		return abs(value - valueReported) > abs(valueReported) * width / 100.0
+	return abs(value - valueReported) > width
+
+# The compiled, immutable plan of a combination: its server, its measurement set, the names of its variables and alternate variables with their indices among all unique measurements, the deadband of each variable, the interval between payloads carrying every variable, and the width of the windows over which the measurements are summarized, with the indices of the measurements that they cover and the server that keeps the raw measurements, if any
+combinationPlan = collections.namedtuple('combinationPlan', ['server', 'measurementSet', 'variableNames', 'variableIndices', 'alternateNames', 'alternateIndices', 'deadbands', 'heartbeat', 'window', 'windowIndices', 'rawServer'])
+
+# A function to compile the plan of every combination, in order, numbering each unique variable just once, and to collect the unique measurements, and the interval and indices of the variables of each measurement set that serves a combination
+def compileCombinations(measurementSets, combinations):
+	measurements = []
+	plans = []
+	intervals = {}
+	setIndices = {}
+	measurementIndices = {}
+	for combination in listIndexed(combinations, 'combination'):
+		setName = str(combination['measurementSet'])
+		variables = measurementSets[setName]
+		variableNames = tuple(str(variable) for variable in listIndexed(variables, 'variable'))
+		alternateNames = tuple(str(variable) for variable in listIndexed(variables, 'variableAlternate'))
+		for variableName in variableNames + alternateNames:
+			if variableName not in measurementIndices:
+				measurementIndices[variableName] = len(measurements)
+				measurements.append(variableName)
+		variableIndices = tuple(measurementIndices[variableName] for variableName in variableNames)
+		alternateIndices = tuple(measurementIndices[variableName] for variableName in alternateNames)
+		plans.append(combinationPlan(str(combination['server']), setName, variableNames, variableIndices, alternateNames, alternateIndices, compileDeadbands(variableNames, variables.get('deadband', {})), float(variables.get('heartbeat', heartbeatDefault)), float(combination.get('window', 0)), tuple(sorted(set(variableIndices + alternateIndices))), combination.get('rawServer')))
+		# Every measurement set that serves a combination is acquired at its own interval, for all its variables
+		intervals[setName] = float(variables.get('interval', intervalDefault))
+		setIndices[setName] = tuple(sorted(set(setIndices.get(setName, ()) + variableIndices + alternateIndices)))
+	return tuple(measurements), plans, intervals, setIndices
 
 # A class to represent the software configuration of this system
 class configurationS(object):
@@ -50,22 +128,143 @@ class configurationS(object):
 		self.settings = []
 		# A list of names of all measurements from every set, unique
 		self.measurements = []
-		# A list of values of all measurements, having a corresponding index as the name
+		# A list of values of all measurements for each host, as numbers or, for parameters, text, having a corresponding index as the name
 		self.measurementValues = []
+		# A list of flags indicating the validity of all measurements for each host, having a corresponding index as the name
+		self.measurementValidity = []
+		# The time at which the values of all measurements were retrieved
+		self.measurementTime = ''
 		# A list of all measurement sets, i.e. a group of names of measurements of interest to a particular element that will receive a corresponding group of values of measurements
 		self.measurementSets = {}
 		# The number of unique measurements, since measurements may be common across sets
 		self.measurementCount = 0
 		# A list of identifiers of all servers specified to accept energy data
 		self.servers = {}
+		# A dictionary of persistent connections against the identifiers of the servers that accept them
+		self.sinks = {}
+		# A dictionary of journals of payloads awaiting despatch against the identifiers of the servers over HTTP
+		self.journals = {}
+		# A dictionary of threads that replay the journals against the identifiers of the servers over HTTP
+		self.drainers = {}
+		# A dictionary of the queues of despatches, each with threads of its own, against the identifiers of the servers
+		self.queues = {}
 		# A list of all server-measurementSet combinations
 		self.combinations = {}
 		# The number of server-measurementSet combinations
 		self.combinationCount = 0
+		# A list of the compiled plans of all combinations, in order
+		self.plans = []
+		# A dictionary of the indices of the variables of each measurement set that serves a combination, against its name
+		self.setIndices = {}
+		# A dictionary of the intervals between acquisitions, in seconds, of each measurement set that serves a combination, against its name
+		self.intervals = {}
+		# A list of the indices of the hosts concerned by each combination, in the order of the plans
+		self.planHosts = []
+		# The settings of the exposition of metrics: a port to serve them on, and a file to write them to, either optional
+		self.metrics = {}
+		# The settings of the local server of the latest snapshot: an address and a port to serve it on, if any
+		self.latest = {}
+		# The historian that keeps the samples of the hosts whose payloads are to be stored, if the configuration names a directory for it
+		self.historian = None
+		# A dictionary of the time of the latest payload carrying every variable, and a dictionary of the values last reported against their names, against each combination and host with deadbands
+		self.reported = {}
+		# A dictionary of the learners and caches of on-demand variables against the identifiers of the servers over HTTP that take single payloads
+		self.prefetchers = {}
+		# A dictionary of the current windows over the measurements of each host, against the index of the combination that summarizes them and the index of the host
+		self.windows = {}
+		# Flag to indicate that the journals are being replayed in the background
+		self.isDraining = False
 	def cancel(self):
 		self.measurementValues = []
-	# A handler function to retrieve settings for the client software from a configuration file
-	def load(self, filename):
+		self.measurementValidity = []
+		self.measurementTime = ''
+	# A handler function to hand over to each server the write of whatever it holds in batches, once due, and report what they still hold
+	def flush(self):
+		for serverName, sink in self.sinks.items():
+			if sink.isDue():
+				self.queues[serverName].submit(self.queues[serverName].attempt, sink.flush)
+			metrics.registry.set('marshal_queue_depth', sink.depth(), server=serverName)
+		for serverName, backlog in self.journals.items():
+			metrics.registry.set('marshal_journal_bytes', backlog.size(), server=serverName)
+	# A handler function to replay the journals in the background
+	def startDrainers(self):
+		self.isDraining = True
+		for thread in self.drainers.values():
+			thread.start()
+	# A handler function to wait until every despatch handed over to the servers so far has been made
+	def wait(self):
+		for queue in self.queues.values():
+			queue.wait()
+	# A handler function to replay some of each journal right away
+	def drain(self):
+		for thread in self.drainers.values():
+			thread.drain(drainBatchCount)
+	# A handler function to close the persistent connections to the servers, and the historian
+	def close(self):
+		for serverName in self.queues.keys():
+			self.closeServer(serverName)
+		self.closeHistorian()
+	# A handler function to open the historian, if the configuration names a directory for it
+	def openHistorian(self):
+		global historian
+		settingsHistorian = self.settings.get('historian', {})
+		if settingsHistorian.get('directory'):
+			if historian is None:
+				historian = common.importLibrary('historian')
+			self.historian = historian.historian(settingsHistorian['directory'], int(settingsHistorian.get('chunkSize', historian.chunkSizeDefault)), float(settingsHistorian.get('flushInterval', historian.flushIntervalDefault)), int(settingsHistorian.get('retentionDays', historian.retentionDaysDefault)))
+	# A handler function to write whatever the historian holds, and close it
+	def closeHistorian(self):
+		if self.historian is not None:
+			self.historian.close()
+			self.historian = None
+	# A handler function to prepare a persistent connection to a server and a queue of despatches to it, and a journal to it and a thread to replay the journal if it is over HTTP
+	def openServer(self, serverName, server):
+		settingsJournal = self.settings.get('journal', {})
+		self.queues[serverName] = workers.serverQueue(serverName, server)
+		if server['protocol'] == 'http':
+			if server.get('format', 'json') == 'batch':
+				self.sinks[serverName] = sinks.sinkHTTPBatch(server)
+			else:
+				self.sinks[serverName] = sinks.sinkHTTP(server)
+				self.prefetchers[serverName] = prefetcher(float(server.get('prefetchTTL', prefetchTTLDefault)), int(server.get('prefetchThreshold', prefetchThresholdDefault)), str(server.get('prefetch', 'False')) == 'True')
+			self.journals[serverName] = journal.journal(os.path.join(settingsJournal.get('directory', directoryJournal), serverName), int(settingsJournal.get('segmentSize', journal.segmentSizeDefault)))
+			# A batch keeps the samples of hosts whose payloads are to be stored in the journal once the server cannot accept them
+			if isinstance(self.sinks[serverName], sinks.sinkHTTPBatch):
+				self.sinks[serverName].journal = self.journals[serverName]
+			self.drainers[serverName] = journal.drainer(self.journals[serverName], self.sinks[serverName], int(settingsJournal.get('batchSize', journal.batchSizeDefault)), float(settingsJournal.get('interval', journal.intervalDefault)))
+			# Once the journals are being replayed in the background, so is this one
+			if self.isDraining:
+				self.drainers[serverName].start()
+		elif server['protocol'] == 'mysql':
+			self.sinks[serverName] = sinks.sinkMySQL(server)
+	# A handler function to make the despatches that await a server, stop replaying its journal, and close the connection to it after writing whatever it holds
+	def closeServer(self, serverName):
+		# The despatches that remain still find the server, its connection and its journal, so stop the queue before forgetting any of them
+		queue = self.queues.get(serverName)
+		if queue is not None:
+			queue.stop()
+		self.queues.pop(serverName, None)
+		thread = self.drainers.pop(serverName, None)
+		if (thread is not None) and thread.is_alive():
+			thread.stop()
+			thread.join()
+		self.journals.pop(serverName, None)
+		self.prefetchers.pop(serverName, None)
+		sink = self.sinks.pop(serverName, None)
+		if sink is not None:
+			sink.close()
+	# A handler function to compile the plan of every combination
+	def compile(self):
+		# Get all the measurement sets
+		self.measurementSets = self.settings['measurementSets']
+		# Get all the server - measurement set combinations
+		self.combinations = self.settings['combinations']
+		self.measurements, self.plans, self.intervals, self.setIndices = compileCombinations(self.measurementSets, self.combinations)
+		# Summarize a count of combinations and measurements
+		self.combinationCount = len(self.plans)
+		self.measurementCount = len(self.measurements)
+	# A handler function to retrieve settings for the client software from a configuration file, opening the historian unless told not to
+	def load(self, filename, isHistorian=True):
 		# Open the JSON-formatted configuration file
 		with open(filename) as filehandle:
 			# Translate JSON to a dictionary and copy it to the object of the defined class
@@ -73,287 +272,829 @@ class configurationS(object):
 		# Close the configuration file
 		filehandle.close()
 		# Digest the configuration dictionary
-		# Get all the servers
+		# Get all the servers, and prepare a persistent connection to each one, and a journal to each one over HTTP
 		self.servers = self.settings['servers']
-		# Get all the measurement sets
-		self.measurementSets = self.settings['measurementSets']
-		# Get all the server - measurement set combinations
-		self.combinations = self.settings['combinations']
-		# Declare temporary variables to traverse the combination dictionary
-		combination = {}
-		combinationIndex = 0;
-		# Traverse the combination dictionary
-		while combination != None:
-			# Attempt to identify a combination ...
+		for serverName, server in self.servers.items():
+			self.openServer(serverName, server)
+		# Get the settings of the exposition of metrics, and of the local server of the latest snapshot
+		self.metrics = self.settings.get('metrics', {})
+		self.latest = self.settings.get('latest', {})
+		# Open the historian, if asked to
+		if isHistorian:
+			self.openHistorian()
+		# Compile the plan of every combination
+		self.compile()
+	# A handler function to apply changed settings, reopening only the servers whose settings changed, so that the others keep their connections and whatever they hold
+	def reload(self, settings):
+		previous = self.settings
+		self.settings = settings
+		# A change to the journals concerns every server over HTTP
+		isJournalChanged = settings.get('journal', {}) != previous.get('journal', {})
+		for serverName in set(previous['servers'].keys()) | set(settings['servers'].keys()):
+			server = settings['servers'].get(serverName)
+			if (server == previous['servers'].get(serverName)) and not (isJournalChanged and (server['protocol'] == 'http')):
+				continue
+			if serverName in previous['servers']:
+				self.closeServer(serverName)
+			if server is not None:
+				self.openServer(serverName, server)
+		self.servers = settings['servers']
+		self.metrics = settings.get('metrics', {})
+		self.latest = settings.get('latest', {})
+		# Reopen the historian only if its settings changed
+		if settings.get('historian', {}) != previous.get('historian', {}):
+			self.closeHistorian()
+			self.openHistorian()
+		self.compile()
+
+# A class to learn which on-demand variables a server keeps requesting of each host, and to hold their values, fetched ahead of the requests, for a short while
+class prefetcher(object):
+	# The constructor for the prefetcher class
+	def __init__(self, ttl=prefetchTTLDefault, threshold=prefetchThresholdDefault, toAttach=False):
+		super(prefetcher, self).__init__()
+		# Interval for which a value holds
+		self.ttl = ttl
+		# Number of consecutive responses that must request a variable before it is prefetched
+		self.threshold = threshold
+		# Flag to indicate that the server accepts the expected variables attached to the primary payload
+		self.toAttach = toAttach
+		# A dictionary of the number of consecutive responses that requested each variable, against the index of the host and the name of the variable
+		self.hits = {}
+		# A dictionary of the values of variables, each with the time at which it was fetched, against the index of the host and the name of the variable
+		self.cache = {}
+		# Lock that lets only one thread at a time touch the counts and the values, as the threads of the server learn while the acquisition loop prefetches
+		self.lock = threading.Lock()
+	# A method to list the variables that are expected to be requested, as the index of the host and the name of the variable
+	def expected(self):
+		with self.lock:
+			return [key for key, count in self.hits.items() if count >= self.threshold]
+	# A method to learn from a response to a payload of a host: the variables that it requested, and those attached to the payload, which it no longer needed to
+	def learn(self, hostIndex, requested, attached):
+		with self.lock:
+			for key in self.hits.keys():
+				if (key[0] == hostIndex) and (key[1] not in requested) and (key[1] not in attached):
+					del self.hits[key]
+					self.cache.pop(key, None)
+			for variableName in requested:
+				self.hits[(hostIndex, variableName)] = self.hits.get((hostIndex, variableName), 0) + 1
+	# A method to hold the value of a variable of a host
+	def store(self, hostIndex, variableName, value, timeNow):
+		with self.lock:
+			self.cache[(hostIndex, variableName)] = (value, timeNow)
+	# A method to serve the value of a variable of a host, unless it has expired or was never fetched
+	def lookup(self, hostIndex, variableName, timeNow):
+		with self.lock:
 			try:
-				combination = self.combinations['combination' + str(combinationIndex)]
-			# ... unless it does not exist ...
+				value, timeFetched = self.cache[(hostIndex, variableName)]
 			except KeyError:
-				# ... in which case the traversal needs to be stopped ...
-				combination = None
-			# ...or else, get all variables whose measurements are required
-			else:
-				variables = self.settings['measurementSets'][str(combination['measurementSet'])]
-				# Declare temporary variables for use when making a list of unique variables
-				variable = {}
-				variableIndex = 0
-				# Traverse the variables dictionary
-				while variable != None:
-					# Attempt to identify a variable ...
-					try:
-						variable = variables['variable' + str(variableIndex)]
-					# ... unless it does not exist ...
-					except KeyError:
-						variable = None
-					# ... or else, append it to the list if not already present ...
-					else:
-						if str(variable) not in self.measurements:
-							self.measurements.append(str(variable))
-					# ... before moving on to the next variable, if any
-					variableIndex += 1
-			# ... before moving on to the next combination, if any
-			combinationIndex += 1
-		# Summarize a count of combinations and measurements
-		self.combinationCount = combinationIndex
-		self.measurementCount = len(self.measurements)
+				return None
+		if timeNow - timeFetched >= self.ttl:
+			return None
+		return value
+	# A method to follow the hosts to their new indices, forgetting those that are gone
+	def remap(self, hostMapping):
+		with self.lock:
+			self.hits = dict(((hostMapping[hostIndex], variableName), count) for (hostIndex, variableName), count in self.hits.items() if hostIndex in hostMapping)
+			self.cache = dict(((hostMapping[hostIndex], variableName), value) for (hostIndex, variableName), value in self.cache.items() if hostIndex in hostMapping)
+	# A method to collect the values of the variables of a host that hold, against their names
+	def held(self, hostIndex, timeNow):
+		values = {}
+		with self.lock:
+			for (index, variableName), (value, timeFetched) in self.cache.items():
+				if (index == hostIndex) and (timeNow - timeFetched < self.ttl):
+					values[variableName] = value
+		return values
 
-# A class to represent the hardware configuration of this system
-class configurationH(object):
-	# The constructor for the configurationH class
-	def __init__(self):
-		super(configurationH, self).__init__()
-		# List of host hardware supported by this version of the software
-		self.devices = {
-			0: ('SMA Solar Technology', 'Sunny Boy', 'inverterSunnyBoy'),
-			1: ('SMA Solar Technology', 'Sunny Web Box', 'loggerSunnyWebBox'),
-			2: ('Helios Systems', 'HS100', 'inverterHelios'),
-			3: ('Enertech', '<blank>'),
-			4: ('Danfoss', '<blank>'),
-			5: ('Statcon Energiaa', 'SMB096', 'combinerSMB096'),
-			6: ('Beijing EPSolar Technology', 'TracerA', 'chargerTracerA'),
-			7: ('Delta Electronics', 'RPI', 'inverterRPI'),
-			8: ('ABB', 'PVS800', 'inverterPVS800')
-		}
-		# An instance of a host
+# A function to list the settings of the hosts named in the hardware configuration, which names either a list of hosts, or a single host
+def listHosts(settings):
+	if 'devices' in settings:
+		return settings['devices']
+	return [settings]
+
+# A class to represent one host, i.e. one device named in the hardware configuration
+class host(object):
+	# The constructor for the host class
+	def __init__(self, settings):
+		super(host, self).__init__()
+		# The settings of the host, as named in the configuration file
+		self.settings = settings
+		# An instance of the host
 		self.device = ''
 		# Type of the host
-		self.deviceType = ''
+		self.deviceType = settings['type']
 		# Manufacturer of the host
-		self.manufacturer = ''
+		self.manufacturer = settings['manufacturer']
 		# Model number of the host
-		self.modelNumber = 0
+		self.modelNumber = settings['modelNumber']
 		# Serial number of the host
-		self.serialNumber = 0
+		self.serialNumber = settings['serialNumber']
 		# Software unique identifier for the host
-		self.identity = {}
+		self.identity = settings['identity']
+		# Flag to indicate local storage
+		self.toStore = settings['toStore']
+		# Flag to indicate attach status
+		self.isAttached = -1
+		# A dictionary of the indices at which the host offers each of its measurements, against their names
+		self.labelIndices = {}
+		# A list of the indices at which the host offers each of the unique measurements, or None for those it does not
+		self.sources = ()
+		# The description of the host, as an indicator of how to parse its measurements, ready to be copied into a payload
+		self.hostData = {}
+	# A method to check if changed settings name the same host, connected the same way, so that it can keep its device handle
+	def isSimilar(self, settings):
+		identity = dict(settings['identity'])
+		identity.pop('threshold', None)
+		identityCurrent = dict(self.identity)
+		identityCurrent.pop('threshold', None)
+		return (settings['manufacturer'], settings['modelNumber'], settings['serialNumber']) == (self.manufacturer, self.modelNumber, self.serialNumber) and (identity == identityCurrent)
+	# A method to apply changed settings of the same host, recompiling its thresholds if they changed
+	def update(self, settings):
+		isChanged = settings['identity'].get('threshold') != self.identity.get('threshold')
+		self.settings = settings
+		self.deviceType = settings['type']
+		self.identity = settings['identity']
+		self.toStore = settings['toStore']
+		if isChanged and (self.isAttached == 0):
+			self.device.setThreshold(self.identity.get('threshold', {}))
+	# A method to name the host uniquely, by its type, model and serial number
+	def key(self):
+		return self.deviceType + self.modelNumber + self.serialNumber
+	# A method to compile the plan by which the host serves a list of unique measurements
+	def compile(self, measurements):
+		if self.isAttached == 0:
+			self.labelIndices = dict((value, key) for key, value in self.device.labels.items())
+		else:
+			self.labelIndices = {}
+		self.sources = tuple(self.labelIndices.get(measurementName) for measurementName in measurements)
+		self.hostData = {
+			'type': self.deviceType,
+			'serialNumber': self.serialNumber,
+			'manufacturer': self.manufacturer,
+			'modelNumber': self.modelNumber,
+			'toStore': self.toStore
+		}
+	# A method to check if the host offers a measurement
+	def offers(self, measurementName):
+		return measurementName in self.labelIndices
+	# A method to serve the value of a measurement as last sampled from the host, without reading it, or None unless it was sampled
+	def sampled(self, measurementName):
+		if (self.isAttached != 0) or (measurementName not in self.labelIndices):
+			return None
+		sample = self.device.history.latest()
+		if sample is None:
+			return None
+		timeSample, values, validity = sample
+		return values[sorted(self.device.labels.keys()).index(self.labelIndices[measurementName])]
+	# A method to report the validity of the host's latest measurements
+	def sanity(self):
+		if self.isAttached == 0:
+			return self.device.sanity
+		return -1
+	# A method to read the value of a measurement from the host
+	def read(self, measurementName):
+		# Unless the host offers the measurement, take it light ...
+		if measurementName not in self.labelIndices:
+			return -1
+		# ... and if it does, then fetch it
+		return self.device.read(self.labelIndices[measurementName])
+
+# A class to represent the hardware configuration of this system
+class configurationH(object):
+	# The constructor for the configurationH class
+	def __init__(self):
+		super(configurationH, self).__init__()
+		# A list of all hosts named in the configuration file
+		self.hosts = []
+		# A list of names of all unique measurements, as compiled
+		self.measurements = ()
+		# A list of the indices of the unique measurements that no host offers, to be read from the Raspberry Pi
+		self.parameterIndices = ()
 		# Flag to indicate load status
 		self.isLoaded = -1
 		# Flag to indicate attach status
 		self.isAttached = -1
-		# Flag to indicate local storage
-		self.toStore = ''
+		# Lock that keeps the threads of the servers, reading on-demand measurements, off the hosts while they are acquired
+		self.lock = threading.Lock()
 	# A handler function to retrieve settings for the hardware from a configuration file
 	def load(self, filename):
 		# Open the JSON-formatted configuration file
 		with open(filename) as filehandle:
 			# Translate JSON to a dictionary and copy it to the object of the defined class
-			settings = json.load(filehandle)
-			self.deviceType = settings['type']
-			self.manufacturer = settings['manufacturer']
-			self.modelNumber = settings['modelNumber']
-			self.serialNumber = settings['serialNumber']
-			self.identity = settings['identity']
-			self.toStore = settings['toStore']
+			self.hosts = [host(hostSettings) for hostSettings in listHosts(json.load(filehandle))]
 			# Raise the load status flag
 			self.isLoaded = 0
 		# Close the configuration file
 		filehandle.close()
 		# Return the load status flag
 		return self.isLoaded
-	# A handler function to populate the instance of the host within the instance of this class
+	# A handler function to populate the instances of the hosts within the instance of this class
 	def attach(self):
-		# Unless the host has been loaded, attach is not possible
+		# Unless the hosts have been loaded, attach is not possible
 		if self.isLoaded == -1:
 			print 'Attach Hardware Configuration Fail - Load incorrect'
 		else:
-			# Declare temporary variables for use when attaching the host to the software
-			deviceIndex = -1
-			# Identify the index of the loaded host
-			for key, value in cH.devices.items():
-				if (value[0] == cH.manufacturer) & (value[1] == cH.modelNumber):
-					deviceIndex = key
-					# Raise attach status flag to indicate that the loaded host can be attached
-					self.isAttached = 1
-			# Unless host can be attached, attach is not possible
-			if self.isAttached == 1:
-				# Initialize the loaded host that needs to be attached
-				with stdoutIO() as s:
-					exec('self.device = equipment.' + self.devices[deviceIndex][2] + '()')
-				# Attach the host
-				self.device.attach(self.identity)
-				# Raise attach status flag to indicate that the loaded host has also been attached
-				self.isAttached = 0
-			else:
-				print 'Attach Hardware Configuration Fail - Host unrecognized'
+			self.isAttached = 0
+			for each in self.hosts:
+				if self.attachHost(each) != 0:
+					self.isAttached = -1
 		# Return the attach status flag
 		return self.isAttached
-	# A handler function to read the value of a variable from the host or the Raspberry Pi
-	def read(self, measurementName):
-		# Attempt to check if the host offers the measurement ...
-		try:
-			measurementIndex = [key for key, value in self.device.labels.items() if value == measurementName][0]
-		# ... unless it doesn't exist ...
-		except IndexError:
-			# ... in which case, attempt to check if the Raspberry Pi offers the measurement ...
-			try:
-				measurementValue = common.getParameterHandler(measurementName)
-			# ... unless it doesn't ...
-			except KeyError:
-				# ... in which case, take it light ...
-				return -1
+	# A handler function to populate the instance of a host
+	def attachHost(self, each):
+		# Identify the profile of the loaded host, which names the class that talks to it
+		profile = profiles.registry.lookup(each.manufacturer, each.modelNumber)
+		# Unless host can be attached, attach is not possible
+		if profile is not None:
+			# Initialize the loaded host that needs to be attached
+			each.device = getattr(equipment, profile.driver)(profile)
+			# Attach the host
+			each.device.attach(each.identity)
+			# Raise attach status flag to indicate that the loaded host has also been attached
+			each.isAttached = 0
+		else:
+			print 'Attach Hardware Configuration Fail - Host unrecognized'
+		return each.isAttached
+	# A handler function to apply a changed list of hosts, keeping the device handles of those that remain, attaching those that are new, and detaching those that are gone, and to return the new indices of the hosts that remain against their old ones
+	def reload(self, hostSettings):
+		hosts = []
+		hostMapping = {}
+		added = []
+		remaining = range(0, len(self.hosts))
+		for settings in hostSettings:
+			# Prefer a host whose settings are unchanged, or else one that differs only in its thresholds or its description ...
+			match = next((hostIndex for hostIndex in remaining if self.hosts[hostIndex].settings == settings), None)
+			if match is None:
+				match = next((hostIndex for hostIndex in remaining if self.hosts[hostIndex].isSimilar(settings)), None)
+			if match is not None:
+				remaining.remove(match)
+				hostMapping[match] = len(hosts)
+				each = self.hosts[match]
+				each.update(settings)
+			# ... or else, prepare a new one
 			else:
-				# ... or return it otherwise ...
-				return measurementValue
+				each = host(settings)
+				added.append(each)
+			hosts.append(each)
+		# Detach the hosts that are gone before attaching the new ones, which may take over their connections and serial buses with changed settings
+		for hostIndex in remaining:
+			if self.hosts[hostIndex].isAttached == 0:
+				self.hosts[hostIndex].device.detach()
+				self.hosts[hostIndex].isAttached = -1
+		for each in added:
+			self.attachHost(each)
+		self.hosts = hosts
+		self.isAttached = 0 if all(each.isAttached == 0 for each in self.hosts) else -1
+		return hostMapping
+	# A handler function to read the value of a parameter from the Raspberry Pi
+	def readParameter(self, measurementName):
+		# Attempt to check if the Raspberry Pi offers the measurement ...
+		try:
+			measurementValue = common.getParameterHandler(measurementName)
+		# ... unless it doesn't ...
+		except KeyError:
+			# ... in which case, take it light ...
+			return -1
 		else:
-			# ... and if it does, then fetch it
-			return self.device.read(measurementIndex)
+			# ... or return it otherwise ...
+			return measurementValue
+	# A handler function to read the value of a variable from a host or the Raspberry Pi
+	def read(self, measurementName, hostIndex=0):
+		if self.hosts[hostIndex].offers(measurementName):
+			with self.lock:
+				return self.hosts[hostIndex].read(measurementName)
+		else:
+			return self.readParameter(measurementName)
+	# A handler function to compile the plan by which every host serves a list of unique measurements
+	def compile(self, measurements):
+		self.measurements = tuple(measurements)
+		for each in self.hosts:
+			each.compile(self.measurements)
+		self.parameterIndices = tuple(measurementIndex for measurementIndex in range(0, len(self.measurements)) if all(each.sources[measurementIndex] is None for each in self.hosts))
+	# A handler function to read some of the unique measurements from some hosts in turn, as hosts sharing a serial port must
+	def poll(self, hostIndices, measurementIndices, values, validity):
+		# Hosts on the pipelined Modbus TCP transport are measured all at once, up front
+		pipelined = [self.hosts[hostIndex].device for hostIndex in hostIndices if self.hosts[hostIndex].identity.get('transport') == 'pipelined']
+		if pipelined:
+			with metrics.registry.timer('marshal_measure_seconds', model='pipelined', serial=''):
+				equipment.measurePipelined(pipelined)
+		for hostIndex in hostIndices:
+			each = self.hosts[hostIndex]
+			hostValues = values[hostIndex]
+			hostValidity = validity[hostIndex]
+			offered = [measurementIndex for measurementIndex in measurementIndices if each.sources[measurementIndex] is not None]
+			if not offered:
+				continue
+			# A host that fails must not hold up the rest
+			try:
+				# Retrieve the measurements of the host up front, unless already retrieved over the pipelined transport, so that their latency is observed apart from their reads
+				if each.identity.get('transport') != 'pipelined':
+					with metrics.registry.timer('marshal_measure_seconds', model=each.modelNumber, serial=each.serialNumber):
+						each.device.measure()
+				for measurementIndex in offered:
+					hostValues[measurementIndex] = each.device.read(each.sources[measurementIndex])
+					hostValidity[measurementIndex] = each.device.isValid(each.sources[measurementIndex])
+			except Exception as error:
+				print 'Read Hardware Fail - ' + each.manufacturer + ' ' + each.modelNumber + ' ' + each.serialNumber + ' - ' + str(error)
+				metrics.registry.increment('marshal_measure_errors_total', model=each.modelNumber, serial=each.serialNumber)
+				values[hostIndex] = [-1] * len(self.measurements)
+				validity[hostIndex] = [0] * len(self.measurements)
+				each.device.sanity = -1
+				continue
+			# Count the measurements that failed their thresholds
+			rejections = sum(1 for measurementIndex in offered if not hostValidity[measurementIndex])
+			if rejections:
+				metrics.registry.increment('marshal_sanity_rejections_total', model=each.modelNumber, serial=each.serialNumber)
+				metrics.registry.increment('marshal_validity_rejections_total', rejections, model=each.modelNumber, serial=each.serialNumber)
+	# A handler function to read some of the unique measurements from every host concurrently, and merge them into one snapshot of a list of values, and a list of validity flags, per host
+	def acquire(self, measurementIndices):
+		with self.lock:
+			timestmp = datetime.datetime.now()
+			values = [[-1] * len(self.measurements) for each in self.hosts]
+			validity = [[0] * len(self.measurements) for each in self.hosts]
+			# Group the hosts so that each group runs in its own thread: hosts sharing a serial port in one group, hosts on the pipelined Modbus TCP transport in another, and every other host alone
+			groups = {}
+			for hostIndex, each in enumerate(self.hosts):
+				if each.isAttached == 0:
+					if each.identity.get('transport') == 'pipelined':
+						groups.setdefault('pipelined', []).append(hostIndex)
+					else:
+						groups.setdefault(each.identity.get('portName', hostIndex), []).append(hostIndex)
+			threads = [threading.Thread(target=self.poll, args=(hostIndices, measurementIndices, values, validity)) for hostIndices in groups.values()]
+			for thread in threads:
+				thread.start()
+			# Meanwhile, read the parameters that no host offers from the Raspberry Pi, just once, and all in one pass
+			parameterIndices = [measurementIndex for measurementIndex in measurementIndices if measurementIndex in self.parameterIndices]
+			parameters = common.getParametersHandler([self.measurements[measurementIndex] for measurementIndex in parameterIndices])
+			for thread in threads:
+				thread.join()
+			# Every host shares the parameters, which have no thresholds
+			for hostValues, hostValidity in zip(values, validity):
+				for measurementIndex in parameterIndices:
+					hostValues[measurementIndex] = parameters[self.measurements[measurementIndex]]
+					hostValidity[measurementIndex] = 1
+			return timestmp, values, validity
+	# A handler function to list the hosts that offer any of some unique measurements, or else, just the first host
+	def concerned(self, measurementIndices):
+		hostIndices = tuple(hostIndex for hostIndex, each in enumerate(self.hosts) if any(each.sources[measurementIndex] is not None for measurementIndex in measurementIndices))
+		return hostIndices or (0,)
 	# A handler function to flush a set of measurements to read afresh in the next iteration
 	def cancel(self):
-		self.device.cancel()
+		with self.lock:
+			for each in self.hosts:
+				if each.isAttached == 0:
+					each.device.cancel()
+	# A handler function to release the instances of the hosts
+	def detach(self):
+		for each in self.hosts:
+			if each.isAttached == 0:
+				each.device.detach()
+				each.isAttached = -1
+		self.isAttached = -1
 
-if __name__ == '__main__':
+# A class to schedule acquisitions of each measurement set at a fixed rate
+class scheduler(object):
+	# The constructor for the scheduler class
+	def __init__(self, intervals):
+		super(scheduler, self).__init__()
+		# A dictionary of intervals, in seconds, against the names of measurement sets
+		self.intervals = intervals
+		# A dictionary of the times of the next acquisition against the names of measurement sets, all due at once
+		timeStart = time.time()
+		self.deadlines = dict((setName, timeStart) for setName in intervals)
+	# A method to report the time of the earliest acquisition
+	def next(self):
+		return min(self.deadlines.values())
+	# A method to apply changed intervals, keeping the deadlines of the measurement sets whose intervals remain, and making the others due at once
+	def update(self, intervals):
+		timeNow = time.time()
+		self.deadlines = dict((setName, self.deadlines[setName] if (setName in self.deadlines) and (self.intervals[setName] == interval) else timeNow) for setName, interval in intervals.items())
+		self.intervals = intervals
+	# A method to collect the measurement sets that are due, and to schedule their next acquisitions
+	def due(self, timeNow):
+		setNames = []
+		for setName, deadline in self.deadlines.items():
+			if deadline <= timeNow:
+				setNames.append(setName)
+				# Deadlines advance by whole intervals from the start so that they never drift, and missed ones are skipped rather than bunched
+				self.deadlines[setName] = deadline + self.intervals[setName] * (int((timeNow - deadline) / self.intervals[setName]) + 1)
+		return setNames
+
+# A class to watch the configuration files for changes, by the times at which they were last modified
+class watcher(object):
+	# The constructor for the watcher class
+	def __init__(self, filenames):
+		super(watcher, self).__init__()
+		# A dictionary of the times at which the files were last modified, or None for those missing, against their names
+		self.mtimes = dict((filename, self.stat(filename)) for filename in filenames)
+	# A method to read the time at which a file was last modified
+	def stat(self, filename):
+		try:
+			return os.stat(filename).st_mtime
+		except OSError:
+			return None
+	# A method to list the files that changed since the last check
+	def changed(self):
+		filenames = []
+		for filename, mtime in self.mtimes.items():
+			mtimeNow = self.stat(filename)
+			if mtimeNow != mtime:
+				self.mtimes[filename] = mtimeNow
+				filenames.append(filename)
+		return filenames
+
+# A handler function to retrieve some of the unique measurements from every host, leaving the rest unread
+def acquire(cS, cH, measurementIndices):
+	# Cancel all measurements
+	cS.cancel()
+	cH.cancel()
+	# Retrieve the on-demand parameters that the servers keep requesting, alongside the measurements ...
+	thread = threading.Thread(target=prefetch, args=(cS, cH, False))
+	thread.start()
+	# ... which are retrieved as one snapshot
+	with metrics.registry.timer('marshal_acquire_seconds'):
+		cS.measurementTime, cS.measurementValues, cS.measurementValidity = cH.acquire(measurementIndices)
+	thread.join()
+	# Then, take the on-demand measurements that the servers keep requesting from the samples of the hosts just measured
+	prefetch(cS, cH, True)
+
+# A function to check if a host was measured in the latest snapshot, by any valid measurement of those that it offers
+def isMeasured(cS, cH, hostIndex):
+	each = cH.hosts[hostIndex]
+	return (hostIndex < len(cS.measurementValidity)) and any(isValid for source, isValid in zip(each.sources, cS.measurementValidity[hostIndex]) if source is not None)
+
+# A handler function to fetch the on-demand variables that the servers keep requesting: either those that the hosts offer, as sampled along with the latest snapshot, without reading the hosts again, or the parameters of the Raspberry Pi, all in one pass
+def prefetch(cS, cH, isOffered):
+	timeNow = time.time()
+	for each in cS.prefetchers.values():
+		expected = [(hostIndex, variableName) for hostIndex, variableName in each.expected() if (hostIndex < len(cH.hosts)) and (cH.hosts[hostIndex].offers(variableName) == isOffered)]
+		if isOffered:
+			for hostIndex, variableName in expected:
+				if not isMeasured(cS, cH, hostIndex):
+					continue
+				value = cH.hosts[hostIndex].sampled(variableName)
+				if value is not None:
+					each.store(hostIndex, variableName, value, timeNow)
+		elif expected:
+			parameters = common.getParametersHandler(list(set(variableName for hostIndex, variableName in expected)))
+			for hostIndex, variableName in expected:
+				each.store(hostIndex, variableName, parameters[variableName], timeNow)
+
+# A handler function to despatch the measurements of a combination to its server, once for each host concerned, either as they are or summarized over windows, handing each payload over to the threads of the server without waiting for it
+def dispatch(cS, cH, planIndex):
+	plan = cS.plans[planIndex]
+	for hostIndex in cS.planHosts[planIndex]:
+		# Each snapshot is a fresh list for every cycle, so the threads of the servers may read it while the next one is acquired
+		hostValues = cS.measurementValues[hostIndex]
+		hostValidity = cS.measurementValidity[hostIndex]
+		if not plan.window:
+			submitHost(cS, cH, plan, hostIndex, cS.measurementTime, hostValues, hostValidity)
+			continue
+		# Keep the raw measurements with another server, if asked to ...
+		if plan.rawServer:
+			submitHost(cS, cH, plan._replace(server=plan.rawServer), hostIndex, cS.measurementTime, hostValues, hostValidity)
+		# ... and add them to the current window, despatching the summary of the previous one once it closes
+		key = (planIndex, hostIndex)
+		if key not in cS.windows:
+			cS.windows[key] = windows.tumblingWindow(plan.window, len(plan.windowIndices))
+		timeSample = time.mktime(cS.measurementTime.timetuple()) + cS.measurementTime.microsecond / 1000000.0
+		summary = cS.windows[key].add(timeSample, [hostValues[measurementIndex] for measurementIndex in plan.windowIndices], [hostValidity[measurementIndex] for measurementIndex in plan.windowIndices])
+		if summary is not None:
+			dispatchSummary(cS, cH, plan, hostIndex, summary)
+
+# A handler function to hand the despatch of the measurements of a combination from one host over to the threads of its server
+def submitHost(cS, cH, plan, hostIndex, timestmp, hostValues, hostValidity, statistics=None):
+	cS.queues[plan.server].submit(timeHost, cS, cH, plan, hostIndex, timestmp, hostValues, hostValidity, statistics)
+
+# A handler function to despatch the measurements of a combination from one host, on a thread of its server, timing it
+def timeHost(cS, cH, plan, hostIndex, timestmp, hostValues, hostValidity, statistics):
+	with metrics.registry.timer('marshal_dispatch_seconds', server=plan.server):
+		dispatchHost(cS, cH, plan, hostIndex, timestmp, hostValues, hostValidity, statistics)
+
+# A handler function to despatch the summary of a window over the measurements of a combination from one host to its server: the mean of each measurement as its value, along with its minimum, maximum, mean, last value and count
+def dispatchSummary(cS, cH, plan, hostIndex, summary):
+	hostValues = [-1] * len(cS.measurements)
+	hostValidity = [0] * len(cS.measurements)
+	statistics = {}
+	for position, measurementIndex in enumerate(plan.windowIndices):
+		if summary.counts[position]:
+			hostValues[measurementIndex] = summary.means[position]
+			hostValidity[measurementIndex] = 1
+			statistics[measurementIndex] = [summary.minimums[position], summary.maximums[position], summary.means[position], summary.lasts[position], summary.counts[position]]
+	submitHost(cS, cH, plan, hostIndex, datetime.datetime.fromtimestamp(summary.timeStart), hostValues, hostValidity, statistics)
+
+# A handler function to despatch the summaries of every window, however short, as when stopping
+def closeWindows(cS, cH):
+	for (planIndex, hostIndex), window in cS.windows.items():
+		summary = window.close()
+		if summary is not None:
+			dispatchSummary(cS, cH, cS.plans[planIndex], hostIndex, summary)
+
+# A handler function to despatch the measurements of a combination from one host to its server, along with their statistics over a window, if summarized, making every attempt on the server through its queue
+def dispatchHost(cS, cH, plan, hostIndex, timestmp, hostValues, hostValidity, statistics=None):
+	# Identify the host
+	each = cH.hosts[hostIndex]
+	# Identify the server for that combination, and its queue
+	server = cS.servers[plan.server]
+	queue = cS.queues[plan.server]
+	# Identify the valuable measurements for that combination, or its alternates if none is
+	variables = [(variableName, measurementIndex) for variableName, measurementIndex in zip(plan.variableNames, plan.variableIndices) if hostValidity[measurementIndex]]
+	# If the server accepts batches, add every measurement of the combination to the batch, as numbers, with their validity
+	if (server['protocol'] == 'http') and (server.get('format', 'json') == 'batch'):
+		cS.sinks[plan.server].add(each.hostData, plan.variableNames, universal2local(timestmp).strip(' IST+0530'), timestmp, [hostValues[measurementIndex] for measurementIndex in plan.variableIndices], [hostValidity[measurementIndex] for measurementIndex in plan.variableIndices], each.sanity(), str(each.toStore) == 'True')
+		if cS.sinks[plan.server].isDue():
+			queue.attempt(cS.sinks[plan.server].flush)
+		return
+	isAlternate = not variables
+	if isAlternate:
+		variables = zip(plan.alternateNames, plan.alternateIndices)
+	if not variables:
+		return
+	# If the measurement set has deadbands, report by exception: only the variables that moved beyond their deadbands since they were last reported, and those without one, ...
+	isExcepted = (not isAlternate) and any(deadband is not None for deadband in plan.deadbands)
+	if isExcepted:
+		key = (plan.server, plan.measurementSet, hostIndex)
+		timeNow = time.time()
+		timeFull, valuesReported = cS.reported.get(key, (0.0, {}))
+		# ... unless the heartbeat is due, when every valuable variable is reported, so that the server can tell silence from an outage
+		isFull = timeNow - timeFull >= plan.heartbeat
+		if not isFull:
+			deadbands = dict(zip(plan.variableNames, plan.deadbands))
+			variables = [(variableName, measurementIndex) for variableName, measurementIndex in variables if (deadbands[variableName] is None) or isMoved(deadbands[variableName], hostValues[measurementIndex], valuesReported.get(variableName))]
+			if not variables:
+				return
+	# Compose the dispatch payload that consists of ...
+	requestPayload = {}
+	# ... the set of measurements, formatted as text only now, on their way out, ...
+	measurementData = dict((variableName, str(hostValues[measurementIndex])) for variableName, measurementIndex in variables)
+	# ... the validity of each measurement of the combination, by which a valuable one missing from the set holds the value last reported, ...
+	requestPayload['v'] = dict((variableName, hostValidity[measurementIndex]) for variableName, measurementIndex in zip(plan.variableNames, plan.variableIndices))
+	# ... the description of the host, as an indicator of how to parse the measurements, ...
+	hostData = dict(each.hostData)
+	hostData['isOnDemand'] = 'False'
+	hostData['isSane'] = each.sanity()
+	# ... and the timestamp of the snapshot, or of the start of the window
+	requestPayload['t'] = universal2local(timestmp).strip(' IST+0530')
+	requestPayload['h'] = hostData
+	requestPayload['m'] = measurementData
+	# A summary carries the width of its window, and the minimum, maximum, mean, last value and count of each measurement of the set that was valid at all within the window
+	if statistics is not None:
+		requestPayload['w'] = plan.window
+		requestPayload['a'] = dict((variableName, statistics[measurementIndex]) for variableName, measurementIndex in variables if measurementIndex in statistics)
+	# If the server accepts HTTP
+	if server['protocol'] == 'http':
+		# Attach the on-demand variables that the server is expected to request, if it accepts them so
+		cache = cS.prefetchers[plan.server]
+		attached = {}
+		if cache.toAttach:
+			attached = dict((variableName, str(value)) for variableName, value in cache.held(hostIndex, time.time()).items())
+			if attached:
+				requestPayload['o'] = attached
+		# If the host's payloads are to be stored, then while older ones await despatch, queue this one behind them ...
+		toStore = str(each.toStore) == 'True'
+		if toStore and cS.journals[plan.server].backlog():
+			cS.journals[plan.server].append(requestPayload)
+			if isExcepted:
+				report(cS, key, timeNow, isFull, variables, hostValues)
+			return
+		# ... or else, despatch it right away, and store it for later if the server cannot accept it
+		response = queue.attempt(cS.sinks[plan.server].post, requestPayload)
+		if response is None:
+			metrics.registry.increment('marshal_dispatch_errors_total', server=plan.server)
+			if toStore:
+				cS.journals[plan.server].append(requestPayload)
+				if isExcepted:
+					report(cS, key, timeNow, isFull, variables, hostValues)
+			return
+		# The values that the server accepted, or that the journal holds, count as reported
+		if isExcepted:
+			report(cS, key, timeNow, isFull, variables, hostValues)
+		# When the server requires additional data on-demand, learn of it, and marshal it
+		responsePayload = json.JSONDecoder().decode(response.text)
+		variableNames = [str(variableName) for variableName in listIndexed(responsePayload, 'variable')]
+		cache.learn(hostIndex, variableNames, attached)
+		if not variableNames:
+			return
+		with metrics.registry.timer('marshal_ondemand_seconds', server=plan.server):
+			# Populate the measurement dictionary of the follow-up request, from the prefetched values where they hold
+			measurementData = {}
+			timeNow = time.time()
+			for variableName in variableNames:
+				value = cache.lookup(hostIndex, variableName, timeNow)
+				if value is None:
+					metrics.registry.increment('marshal_ondemand_cache_misses_total', server=plan.server)
+					value = cH.read(variableName, hostIndex)
+				else:
+					metrics.registry.increment('marshal_ondemand_cache_hits_total', server=plan.server)
+				measurementData[variableName] = str(value)
+			# Compose a fresh dispatch payload that consists of nothing but the set of measurements, the description of the host, as an indicator of how to parse the measurements, and the timestamp
+			hostData = dict(hostData)
+			hostData['isOnDemand'] = "True"
+			requestPayload = {}
+			# requestPayload['t'] = str(datetime.datetime.now())
+			requestPayload['t'] = universal2local(datetime.datetime.now()).strip(' IST+0530')
+			requestPayload['h'] = hostData
+			requestPayload['m'] = measurementData
+			if queue.attempt(cS.sinks[plan.server].post, requestPayload) is None:
+				metrics.registry.increment('marshal_dispatch_errors_total', server=plan.server)
+	# If the server is a MySQL database, batch the row with others
+	elif server['protocol'] == 'mysql':
+		cS.sinks[plan.server].insert(hostData['type'] + hostData['modelNumber'], requestPayload['t'], measurementData)
+		if cS.sinks[plan.server].isDue():
+			queue.attempt(cS.sinks[plan.server].flush)
+		if isExcepted:
+			report(cS, key, timeNow, isFull, variables, hostValues)
+
+# A handler function to remember the values of a combination from one host as reported, and the time of the heartbeat, if it was one
+def report(cS, key, timeNow, isFull, variables, hostValues):
+	timeFull, valuesReported = cS.reported.get(key, (0.0, {}))
+	if isFull:
+		timeFull = timeNow
+	for variableName, measurementIndex in variables:
+		valuesReported[variableName] = hostValues[measurementIndex]
+	cS.reported[key] = (timeFull, valuesReported)
+
+# A handler function to publish the measurements of the latest snapshot that each host offers, and the parameters as last read, to the local server, which never reads the hosts itself
+def publish(cS, cH, measurementIndices):
+	hosts = []
+	for hostIndex, each in enumerate(cH.hosts):
+		hostValues = cS.measurementValues[hostIndex]
+		hostValidity = cS.measurementValidity[hostIndex]
+		measurements = dict((cS.measurements[measurementIndex], (hostValues[measurementIndex], hostValidity[measurementIndex])) for measurementIndex in measurementIndices if each.sources[measurementIndex] is not None)
+		hosts.append((each.key(), each.hostData, measurements))
+	latest.snapshot.publish(universal2local(cS.measurementTime).strip(' IST+0530'), hosts, common.getCachedParameters())
+
+# A handler function to keep the latest sample of every host whose payloads are to be stored in the historian, with every measurement that the host offers
+def record(cS, cH):
+	for each in cH.hosts:
+		if (each.isAttached != 0) or (str(each.toStore) != 'True'):
+			continue
+		sample = each.device.history.latest()
+		if sample is not None:
+			timeSample, values, validity = sample
+			cS.historian.append(each.key(), [each.device.labels[index] for index in sorted(each.device.labels.keys())], timeSample, values, validity)
+
+# A handler function to run one cycle of acquisition and despatch for a list of measurement sets
+def cycle(cS, cH, setNames):
+	with metrics.registry.timer('marshal_cycle_seconds'):
+		# Retrieve the variables that those measurement sets require ...
+		measurementIndices = set()
+		for setName in setNames:
+			measurementIndices.update(cS.setIndices[setName])
+		acquire(cS, cH, sorted(measurementIndices))
+		# Publish the snapshot to the local server, if there is one, and keep the samples in the historian, if there is one
+		if cS.latest.get('port'):
+			publish(cS, cH, measurementIndices)
+		if cS.historian is not None:
+			record(cS, cH)
+		# ... and hand each combination that they serve over to the queue of its server, so that no server holds up the cycle
+		for planIndex, plan in enumerate(cS.plans):
+			if plan.measurementSet in setNames:
+				dispatch(cS, cH, planIndex)
+		# Write the batches that have become due, likewise
+		cS.flush()
+	# Write the metrics for the text file collector, if asked to
+	if cS.metrics.get('file'):
+		metrics.registry.write(cS.metrics['file'])
+
+# A handler function to load and attach both configurations, and compile the plan by which the hosts serve the combinations, recording the time that each step takes in a profile, if given one, and opening the historian unless told not to
+def setup(profile=None, isHistorian=True):
+	timeStart = time.time()
 	cH = configurationH()
 	cS = configurationS()
 	# Load the software configuration
-	cS.load('/home/pi/marshal/cS.json')
+	cS.load(filenameS, isHistorian)
+	timeLoadedS = time.time()
 	# Load the hardware configuration
-	cH.load('/home/pi/marshal/cH.json')
-	# Attach the hardware device
+	cH.load(filenameH)
+	timeLoadedH = time.time()
+	# Attach the hardware devices
 	cH.attach()
-	# Cancel all measurements
-	cS.cancel()
-	cH.cancel()
-	# Retrieve the measurements for all unique variables
-	for measurementName in cS.measurements:
-		cS.measurementValues.append(str(cH.read(measurementName)))
-	# toNote: Filter checks must not be universal
-	# If the filter has been triggered, exit
-	# if cH.device.sanity == -1:
-	# 	exit()
-	# toDo: if cH.toStore is set, then log locally
-	# Traverse the combination dictionary
-	for combinationIndex in range(0, cS.combinationCount - 1):
-		# Sequentially get each combination
-		combination = cS.combinations['combination' + str(combinationIndex)]
-		# Identify the server for that combination
-		server = cS.servers[combination['server']]
-		# Identify the measurements for that combination
-		variables = cS.measurementSets[combination['measurementSet']]
-		# Compose the dispatch payload that consists of ...
-		requestPayload = {}
-		# ... the set of measurements, ...
-		measurementData = {}
-		# Declare temporary variables for use when composing the payload of measurements
-		variableName = ''
-		variableIndex = 0
-		# Traverse the list of measurements required for this combination
-		while variableName != None:
-			# Attempt to sequentially retrieve names of variables required for this combination ...
+	timeAttached = time.time()
+	# Compile the plan
+	link(cS, cH)
+	if profile is not None:
+		profile.append(('Load software configuration', timeLoadedS - timeStart))
+		profile.append(('Load hardware configuration', timeLoadedH - timeLoadedS))
+		profile.append(('Attach hosts', timeAttached - timeLoadedH))
+		profile.append(('Compile plan', time.time() - timeAttached))
+	return cS, cH
+
+# A handler function to compile the plan by which the hosts serve the combinations
+def link(cS, cH):
+	cH.compile(cS.measurements)
+	cS.planHosts = [cH.concerned(plan.variableIndices) for plan in cS.plans]
+
+# A handler function to apply changes to either configuration file in place, touching only what changed: servers whose settings changed are reopened, hosts that were added or removed are attached or detached, and hosts whose thresholds changed recompile them, while everything else keeps its connections, handles and samples
+def reload(cS, cH, timetable, filenames):
+	# Parse every changed file before applying any change, so that a file caught half-written changes nothing
+	settingsS = None
+	hostSettings = None
+	if filenameS in filenames:
+		with open(filenameS) as filehandle:
+			settingsS = json.load(filehandle)
+	if filenameH in filenames:
+		with open(filenameH) as filehandle:
+			hostSettings = listHosts(json.load(filehandle))
+	planMapping = dict((planIndex, planIndex) for planIndex in range(0, len(cS.plans)))
+	hostMapping = dict((hostIndex, hostIndex) for hostIndex in range(0, len(cH.hosts)))
+	if settingsS is not None:
+		measurements, plans, intervals, setIndices = compileCombinations(settingsS['measurementSets'], settingsS['combinations'])
+		# The combinations that remain keep their windows, and the others despatch them now, while their servers remain
+		planMapping = dict((planIndex, plans.index(plan)) for planIndex, plan in enumerate(cS.plans) if plan in plans)
+		for (planIndex, hostIndex), window in cS.windows.items():
+			if planIndex not in planMapping:
+				summary = window.close()
+				if summary is not None:
+					dispatchSummary(cS, cH, cS.plans[planIndex], hostIndex, summary)
+	# Let every despatch handed over so far be made against the plans and hosts that it was handed over with
+	cS.wait()
+	if settingsS is not None:
+		cS.reload(settingsS)
+		timetable.update(cS.intervals)
+	if hostSettings is not None:
+		hostMapping = cH.reload(hostSettings)
+	link(cS, cH)
+	# Follow the combinations and hosts that remain to their new indices
+	cS.windows = dict(((planMapping[planIndex], hostMapping[hostIndex]), window) for (planIndex, hostIndex), window in cS.windows.items() if (planIndex in planMapping) and (hostIndex in hostMapping))
+	cS.reported = dict(((serverName, setName, hostMapping[hostIndex]), reported) for (serverName, setName, hostIndex), reported in cS.reported.items() if hostIndex in hostMapping)
+	for each in cS.prefetchers.values():
+		each.remap(hostMapping)
+
+# A handler function to run a single cycle for every measurement set, as when started by cron
+def runOnce():
+	# Leave the historian to the daemon: a run on its own would close a chunk of a single sample, whose header, names and lengths take more space than the raw row
+	cS, cH = setup(isHistorian=False)
+	cycle(cS, cH, cS.setIndices.keys())
+	# Despatch the summaries of the windows, and wait for every despatch, then replay some of the journals, and write whatever remains in batches before exiting
+	closeWindows(cS, cH)
+	cS.wait()
+	cS.drain()
+	cS.close()
+
+# A handler function to keep the configurations and device handles alive across cycles until a signal arrives
+def runDaemon():
+	cS, cH = setup()
+	timetable = scheduler(cS.intervals)
+	# Replay the journals in the background
+	cS.startDrainers()
+	# Serve the metrics over HTTP, if asked to
+	if cS.metrics.get('port'):
+		metrics.exporter(int(cS.metrics['port']), cS.metrics.get('address', metrics.addressDefault)).start()
+	# Serve the latest snapshot to local clients, if asked to
+	if cS.latest.get('port'):
+		latest.server(int(cS.latest['port']), cS.latest.get('address', latest.addressDefault), lambda: cS.historian).start()
+	# Stop at the end of the current cycle on SIGTERM or SIGINT
+	stopEvent = threading.Event()
+	signal.signal(signal.SIGTERM, lambda signalNumber, frame: stopEvent.set())
+	signal.signal(signal.SIGINT, lambda signalNumber, frame: stopEvent.set())
+	# Reload the configurations when their files change, or on SIGHUP
+	watch = watcher([filenameS, filenameH])
+	reloadEvent = threading.Event()
+	signal.signal(signal.SIGHUP, lambda signalNumber, frame: reloadEvent.set())
+	while not stopEvent.is_set():
+		filenames = watch.changed()
+		if reloadEvent.is_set():
+			reloadEvent.clear()
+			filenames = [filenameS, filenameH]
+		if filenames:
 			try:
-				if cH.device.sanity == -1:
-					variableName = variables['variableAlternate' + str(variableIndex)]
-				else:
-					variableName = variables['variable' + str(variableIndex)]
-			# ... until the end is reached ...
-			except KeyError:
-				# ... in which case the traversal needs to be stopped ...
-				variableName = None
-			# ... or else, add the measurement to the dispatch payload ...
-			else:
-				measurementData[str(variableName)] = cS.measurementValues[cS.measurements.index(str(variableName))]
-			# ... before moving to the next variable, if any
-			variableIndex += 1
-		# ... the description of the host, as an indicator of how to parse the measurements, ...
-		hostData = {}
-		hostData['type'] = cH.deviceType
-		hostData['serialNumber'] = cH.serialNumber
-		hostData['manufacturer'] = cH.manufacturer
-		hostData['modelNumber'] = cH.modelNumber
-		hostData['toStore'] = cH.toStore
-		hostData['isOnDemand'] = 'False'
-		hostData['isSane'] = cH.device.sanity
-		# ... and the timestamp
-		# requestPayload['t'] = str(datetime.datetime.now())
-		requestPayload['t'] = universal2local(datetime.datetime.now()).strip(' IST+0530')
-		requestPayload['h'] = hostData
-		requestPayload['m'] = measurementData
-		if variableIndex == 1:
-			exit()
-		# If the server accepts HTTP
-		if server['protocol'] == 'http':
-			# Beware of self-signed certificates ...
-			if not server['certificate']:
-				# ... and port numbers
-				if not server['portnumber']:
-					response = requests.post(server['protocol'] + "://" + server['hostname'] + server['path'], auth=(server['username'], server['password']), json=requestPayload)
-				else:
-					response = requests.post(server['protocol'] + "://" + server['hostname'] + ":" + server['portnumber'] + server['path'], auth=(server['username'], server['password']), json=requestPayload)
-			else:
-				if not server['portnumber']:
-					response = requests.post(server['protocol'] + "://" + server['hostname'] + server['path'], auth=(server['username'], server['password']), json=requestPayload, verify=server['certificate'])
-				else:
-					response = requests.post(server['protocol'] + "://" + server['hostname'] + ":" + server['portnumber'] + server['path'], auth=(server['username'], server['password']), json=requestPayload, verify=server['certificate'])
-			# When the server requires additional data on-demand, marshal it
-			responsePayload = json.JSONDecoder().decode(response.text)
-			# Reset the measurement dictionary
-			measurementData = {}
-			# Create temporary variables to find out what additional data the server requires
-			variableName = ''
-			variableIndex = 0
-			# Parse the response content
-			while variableName != None:
-				# Attempt to identify a variable ...
-				try:
-					variableName = responsePayload['variable' + str(variableIndex)]
-				# ... unless it does not exist ...
-				except KeyError:
-					variableName = None
-				# ... or else, populate the measurement dictionary of the follow-up request ...
-				else:
-					measurementData[str(variableName)] = cH.read(str(variableName))
-				# ... before moving on to the next variable, if any
-				variableIndex += 1
-			# If there are on-demand measurements, shoot the follow-up request
-			if variableIndex > 1:
-				# Compose the dispatch payload that consists of the set of measurements, the description of the host, as an indicator of how to parse the measurements, and the timestamp
-				hostData['isOnDemand'] = "True"
-				# requestPayload['t'] = str(datetime.datetime.now())
-				requestPayload['t'] = universal2local(datetime.datetime.now()).strip(' IST+0530')
-				requestPayload['h'] = hostData
-				requestPayload['m'] = measurementData
-				# Beware of self-signed certificates ...
-				if not server['certificate']:
-					# ... and port numbers
-					if not server['portnumber']:
-						response = requests.post(server['protocol'] + "://" + server['hostname'] + server['path'], auth=(server['username'], server['password']), json=requestPayload)
-					else:
-						response = requests.post(server['protocol'] + "://" + server['hostname'] + ":" + server['portnumber'] + server['path'], auth=(server['username'], server['password']), json=requestPayload)
-				else:
-					if not server['portnumber']:
-						response = requests.post(server['protocol'] + "://" + server['hostname'] + server['path'], auth=(server['username'], server['password']), json=requestPayload, verify=server['certificate'])
-					else:
-						response = requests.post(server['protocol'] + "://" + server['hostname'] + ":" + server['portnumber'] + server['path'], auth=(server['username'], server['password']), json=requestPayload, verify=server['certificate'])
-				responsePayload = json.JSONDecoder().decode(response.text)
-		# toDo: use an ORM
-		elif server['protocol'] == 'mysql':
-			columns = ""
-			values = ""
-			for columnName, value in measurementData.iteritems():
-				columns += ", `" + columnName + "`"
-				values += ", " + value
-			query = "INSERT INTO `" + hostData['type'] + hostData['modelNumber'] + "` (`isSynced`, `timestmp`" + columns + ") VALUES (False, '" + requestPayload['t'] + "'" + values + ");"
-			connectionHandle = MySQLdb.connect(server['hostname'], server['username'], server['password'], server['databasename'])
-			connectionCursor = connectionHandle.cursor()
-			connectionCursor.execute(query)
-			connectionHandle.commit()
-			connectionHandle.close()
+				reload(cS, cH, timetable, filenames)
+			except Exception as error:
+				print 'Reload Configuration Fail - ' + str(error)
+		# Sleep until the earliest acquisition is due, unless a signal arrives meanwhile, checking the configuration files now and then
+		delay = timetable.next() - time.time()
+		if delay > 0:
+			stopEvent.wait(min(delay, reloadInterval))
+			continue
+		# Run the cycle for every measurement set that is due, and keep going when one fails
+		try:
+			cycle(cS, cH, timetable.due(time.time()))
+		except Exception as error:
+			print 'Cycle Fail - ' + str(error)
+	# Despatch the summaries of the windows, and wait for every despatch before releasing the hosts, which they may read on-demand
+	closeWindows(cS, cH)
+	cS.wait()
+	cS.close()
+	cH.detach()
+
+# A handler function to report the time taken to start: to import the modules of the client, to import each library that the configurations need, and to load and attach them
+def runProfile():
+	profile = []
+	cS, cH = setup(profile)
+	print 'Startup Profile'
+	print '%-40s %10.1f ms' % ('Import client modules', importTime * 1000.0)
+	# The libraries are imported on demand while loading and attaching, and their times count towards those steps too
+	for moduleName, duration in sorted(common.importTimes.items()):
+		print '%-40s %10.1f ms' % ('Import ' + moduleName, duration * 1000.0)
+	for step, duration in profile:
+		print '%-40s %10.1f ms' % (step, duration * 1000.0)
+	cH.detach()
+	cS.close()
+
+if __name__ == '__main__':
+	if '--profile' in sys.argv[1:]:
+		runProfile()
+	elif '--daemon' in sys.argv[1:]:
+		runDaemon()
+	else:
+		runOnce()
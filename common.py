@@ -1,53 +1,92 @@
 # Forks processes to retrieve parameter values through shell commands
 import os
-# Handle output of executing python commands stored as strings in the dictionary
+# Retrieves the host name
+import socket
+# Retrieves the user name
+import pwd
+# Handle cache expiry and dates
+import time
+# Serialize access to the cache of parameter values
+import threading
+# Find the libraries that are already imported
 import sys
-# Handle output of executing python commands stored as strings in the dictionary
-import StringIO
-# Handle output of executing python commands stored as strings in the dictionary
-import contextlib
-# Retrieves the IP address
-import netifaces as ni
+# Import libraries only once they are needed
+import importlib
+# Time the retrieval of parameters
+import metrics
 
-# Handle output of executing python commands stored as strings in the dictionary
-@contextlib.contextmanager
-def stdoutIO(stdout=None):
-	old = sys.stdout
-	if stdout is None:
-		stdout = StringIO.StringIO()
-	sys.stdout = stdout
-	yield stdout
-	sys.stdout = old
+# A dictionary of the time, in seconds, taken to import each library imported on demand, against its name
+importTimes = {}
 
-# A dictionary of parameter names against their shell command names
+# A function to import a library only once something needs it, timing the import
+def importLibrary(moduleName):
+	if moduleName not in sys.modules:
+		timeStart = time.time()
+		importlib.import_module(moduleName)
+		importTimes[moduleName] = time.time() - timeStart
+	return sys.modules[moduleName]
+
+# A dictionary of parameter names against their shell command names, for what cannot be read from a file
 commandsDictionarySh = {
 	# Temperature of the GPU, Raspberry Pi-specific
-	'temperature_gpu': '/opt/vc/bin/vcgencmd measure_temp | awk \'{print substr($1, 6, 4)}\'',
+	'temperature_gpu': '/opt/vc/bin/vcgencmd measure_temp | awk \'{print substr($1, 6, 4)}\''
+}
+
+# A function to read a file, just once for every call that passes the same dictionary of file contents
+def readFile(filename, files):
+	if filename not in files:
+		try:
+			with open(filename) as filehandle:
+				files[filename] = filehandle.read()
+		except IOError:
+			files[filename] = ''
+	return files[filename]
+
+# A function to read the value of a field from /proc/cpuinfo, Raspberry Pi-specific
+def readProcessor(fieldName, files):
+	for line in readFile('/proc/cpuinfo', files).splitlines():
+		if line.startswith(fieldName):
+			return line.split(':', 1)[1].strip()
+	return ''
+
+# A function to read the IPv4 address of a network adapter
+def readAddress(adapterName):
+	try:
+		ni = importLibrary('netifaces')
+		return ni.ifaddresses(adapterName)[ni.AF_INET][0]['addr']
+	except (KeyError, IndexError, ValueError):
+		return ''
+
+# A dictionary of parameter names against the functions that read them, given a dictionary of file contents, and the intervals, in seconds, for which their values hold, or None if they hold for the life of the process
+parametersDictionary = {
+	# Temperature of the GPU, Raspberry Pi-specific
+	'temperature_gpu': (lambda files: os.popen(commandsDictionarySh['temperature_gpu']).read().strip('\n'), 5.0),
 	# Temperature of the CPU
-	'temperature_cpu': 'cat /sys/class/thermal/thermal_zone0/temp',
+	'temperature_cpu': (lambda files: readFile('/sys/class/thermal/thermal_zone0/temp', files).strip('\n'), 5.0),
 	# System information
-	'uname': 'uname -a',
+	'uname': (lambda files: ' '.join(os.uname()), None),
 	# Build information, Raspberry Pi-specific
-	'reference': 'cat /etc/rpi-issue',
+	'reference': (lambda files: readFile('/etc/rpi-issue', files).strip('\n'), None),
 	# OS information
-	'release_os': 'cat /etc/os-release',
+	'release_os': (lambda files: readFile('/etc/os-release', files).strip('\n'), None),
 	# Processor Revision Number, Raspberry Pi-specific
-	'revision_processor': 'cat /proc/cpuinfo | grep "Revision" | cut -d \' \' -f 2',
+	'revision_processor': (lambda files: readProcessor('Revision', files), None),
 	# Processor Serial Number, Raspberry Pi-specific
-	'serialnumber_processor': 'cat /proc/cpuinfo | grep "Serial" | cut -d \' \' -f 2',
-	'hostname': 'echo $HOSTNAME',
-	'username': 'whoami',
-	'date': 'date'
-}
-
-# A dictionary of parameter names against their python command names
-commandsDictionaryPy = {
+	'serialnumber_processor': (lambda files: readProcessor('Serial', files), None),
+	'hostname': (lambda files: socket.gethostname(), 60.0),
+	'username': (lambda files: pwd.getpwuid(os.geteuid()).pw_name, None),
+	'date': (lambda files: time.strftime('%a %b %e %H:%M:%S %Z %Y'), 0.0),
 	# IPv4 address of the 'eth0' adapter
-	'ipv4_eth0': 'ni.ifaddresses(\'eth0\')[2][0][\'addr\']',
+	'ipv4_eth0': (lambda files: readAddress('eth0'), 30.0),
 	# IPv4 address of the 'wlan0' adapter
-	'ipv4_wlan0': 'ni.ifaddresses(\'wlan0\')[2][0][\'addr\']'
+	'ipv4_wlan0': (lambda files: readAddress('wlan0'), 30.0)
 }
 
+# A dictionary of the values of parameters, each with the time at which it was read, against their names
+parametersCache = {}
+# Lock that guards the cache of parameter values
+parametersLock = threading.Lock()
+
 # A dictionary of formatting elements for different types of response formats
 styleguide = {
 	'header': {
@@ -73,18 +112,35 @@ styleguide = {
 	}
 }
 
-# A wrapper function to retrieve values of parameters using either Shell or pure Python
+# A wrapper function to retrieve the values of many parameters in one pass, reading every file at most once
+def getParametersHandler(parameterNames):
+	values = {}
+	files = {}
+	timeNow = time.time()
+	with parametersLock:
+		for parameterName in parameterNames:
+			# Unless the name of the requested parameter exists in the dictionary, it's a no-go
+			if parameterName not in parametersDictionary:
+				values[parameterName] = ''
+				continue
+			reader, interval = parametersDictionary[parameterName]
+			# Serve the cached value, unless it has expired ...
+			if parameterName in parametersCache:
+				value, timeRead = parametersCache[parameterName]
+				if (interval is None) or (timeNow - timeRead < interval):
+					values[parameterName] = value
+					continue
+			# ... in which case, read it afresh
+			with metrics.registry.timer('marshal_parameter_seconds', parameter=parameterName):
+				values[parameterName] = reader(files)
+			parametersCache[parameterName] = (values[parameterName], timeNow)
+	return values
+
+# A wrapper function to retrieve the value of a parameter
 def getParameterHandler(parameterName):
-	# If the name of the requested parameter exists in the Shell dictionary, ...
-	if parameterName in commandsDictionarySh.keys():
-		# ... then spawn a process to retrieve that parameter's value and return the same
-		return os.popen(commandsDictionarySh[parameterName]).read().strip('\n')
-	# If the requested parameter's value can be computer otherwise, ...
-	elif parameterName in commandsDictionaryPy.keys():
-		# ... then do it
-		with stdoutIO() as s:
-			exec(commandsDictionaryPy[parameterName])
-		return s.getvalue()
-	# Or else, it's a no-go
-	else:
-		return ''
+	return getParametersHandler([parameterName])[parameterName]
+
+# A function to serve the values of every parameter read so far, as last read, without reading any afresh
+def getCachedParameters():
+	with parametersLock:
+		return dict((parameterName, value) for parameterName, (value, timeRead) in parametersCache.items())
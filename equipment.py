@@ -1,330 +1,446 @@
 # Generate timestamps
 import datetime
-# Handle communications over modbus RS485/RS422/RS232
-import minimalmodbus
-# Handle communications over modbus TCP
-from pyModbusTCP.client import ModbusClient
+# Handle sleeps and delays
+import time
+# Parse web pages
+import re
+# Serialize requests from many hosts that share a bus
+import threading
+# Handle communications over modbus TCP, pipelined on one event loop
+import transport
+# Import the libraries of each kind of communications only once a host needs them: minimalmodbus over modbus RS485/RS422/RS232, pyModbusTCP over modbus TCP, and requests over HTTP
+import common
+# Time the checks of measurements against their thresholds
+import metrics
+# Store samples as compact, typed arrays
+import array
+# Keep the latest samples of each host
+import samples
+# Decode blocks of registers as the profile of each host describes them
+import profiles
 
-# Host interface for the "ABB PVS800" Central Inverter
-class inverterPVS800(object):
-	# The constructor for the "ABB PVS800" Central Inverter
-	def __init__(self):
-		super(inverterPVS800, self).__init__()
+# A function to merge a map of register addresses, each of a number of registers, into as few block reads as possible
+def planRegisterBlocks(registerAddresses, maximumGap, maximumLength, registerCounts=None):
+	# Each block is a list of its start address, its register count and the (measurement index, offset) pairs it serves
+	blocks = []
+	# Traverse the measurements in the order of their register addresses
+	for index, registerAddress in sorted(registerAddresses.items(), key=lambda item: item[1]):
+		registerCount = registerCounts.get(index, 1) if registerCounts else 1
+		# Extend the last block if the registers are close enough to its end, and the block does not grow too long ...
+		if blocks and (registerAddress - (blocks[-1][0] + blocks[-1][1]) <= maximumGap) and (registerAddress + registerCount - blocks[-1][0] <= maximumLength):
+			blocks[-1][1] = max(blocks[-1][1], registerAddress - blocks[-1][0] + registerCount)
+			blocks[-1][2].append((index, registerAddress - blocks[-1][0]))
+		# ... or else, open a new block
+		else:
+			blocks.append([registerAddress, registerCount, [(index, 0)]])
+	return blocks
+
+# A function to compile the thresholds on the measurements of a host into lists of lower and upper bounds, in the order of its labels
+def compileThresholds(labels, threshold, isInclusive):
+	# Each bound is a value, and a flag to indicate if a measurement may equal it; 'min' and 'max' bounds are inclusive where the host says so, 'pass' bounds never are
+	minimums = []
+	maximums = []
+	for index in sorted(labels.keys()):
+		minimum = (float('-inf'), True)
+		maximum = (float('inf'), True)
+		# Attempt to retrieve a threshold on the value of the measurement ...
+		try:
+			entry = threshold[labels[index]]
+		#  ... unless it doesn't exist ...
+		except KeyError:
+			pass
+		else:
+			# ... or otherwise, identify the type of filter
+			if entry['type'] == 'max':
+				maximum = (float(entry['value']), isInclusive)
+			if entry['type'] == 'min':
+				minimum = (float(entry['value']), isInclusive)
+			if entry['type'] == 'pass':
+				minimum = (float(entry['valueMin']), False)
+				maximum = (float(entry['valueMax']), False)
+		minimums.append(minimum)
+		maximums.append(maximum)
+	return minimums, maximums
+
+# A function to check a list of values against compiled bounds in one pass, setting each flag of a list to 1 where its value complies and 0 otherwise
+def checkThresholds(values, minimums, maximums, validity):
+	for index, (value, (minimum, isMinimum), (maximum, isMaximum)) in enumerate(zip(values, minimums, maximums)):
+		validity[index] = ((value > minimum) or (isMinimum and value == minimum)) and ((value < maximum) or (isMaximum and value == maximum))
+
+# A scheduler for the requests to every slave that shares one serial port
+class serialBus(object):
+	# The constructor for the serialBus class
+	def __init__(self, portName, baudrate):
+		super(serialBus, self).__init__()
+		# Space for storing the port name of the bus
+		self.portName = portName
+		# Space for storing the baudrate of the bus
+		self.baudrate = baudrate
+		# The TTY device's file handle, shared by every slave on the bus
+		self.handle = common.importLibrary('minimalmodbus').Instrument(portName, 1)
+		self.handle.serial.baudrate = baudrate
+		# The silent interval between frames is 3.5 characters of 11 bits each
+		self.gap = 3.5 * 11.0 / float(baudrate)
+		# The time after which the bus is free to carry the next frame
+		self.timeFree = 0.0
+		# The number of slaves attached to the bus
+		self.slaveCount = 0
+		# Lock that lets only one request at a time onto the bus
+		self.lock = threading.Lock()
+	# A method to read a block of holding registers from one slave on the bus
+	def readRegisters(self, slaveAddress, registerAddress, registerCount):
+		with self.lock:
+			# Wait out whatever remains of the silent interval since the last frame
+			delay = self.timeFree - time.time()
+			if delay > 0:
+				time.sleep(delay)
+			# Address the slave and shoot the request
+			self.handle.address = slaveAddress
+			try:
+				return self.handle.read_registers(registerAddress, registerCount, functioncode = 3)
+			finally:
+				self.timeFree = time.time() + self.gap
+
+# A dictionary of serial buses against their port names
+buses = {}
+# Lock that guards the dictionary of serial buses
+busesLock = threading.Lock()
+
+# A handler function to share the serial bus of a port with one more slave
+def attachBus(portName, baudrate):
+	with busesLock:
+		# Open the port unless another slave already has ...
+		if portName not in buses:
+			buses[portName] = serialBus(portName, baudrate)
+		# ... in which case, its baudrate holds for every slave
+		elif buses[portName].baudrate != baudrate:
+			print 'Attach Bus Warning - Baudrate mismatch on ' + portName
+		buses[portName].slaveCount += 1
+		return buses[portName]
+
+# A handler function to release the serial bus of a port, closing it when the last slave leaves
+def detachBus(portName):
+	with busesLock:
+		if portName in buses:
+			buses[portName].slaveCount -= 1
+			if buses[portName].slaveCount == 0:
+				buses[portName].handle.serial.close()
+				del buses[portName]
+
+# A function to measure many hosts over the pipelined transport at once, with every request of every host outstanding together on the shared event loop
+def measurePipelined(devices):
+	for device in devices:
+		device.submit()
+	transport.reactor.run()
+	for device in devices:
+		device.collect()
+
+# Host interface for any Modbus host whose register map is given by its profile, leaving each transport to attach to the host and fetch its blocks of registers
+class deviceModbus(object):
+	# The constructor for a Modbus host of a profile
+	def __init__(self, profile):
+		super(deviceModbus, self).__init__()
+		# The profile of the host
+		self.profile = profile
 		# List of all measurements offered by the host
-		self.labels = {
-			1: 'currentGrid',
-			2: 'powerGrid',
-			3: 'frequencyGrid',
-			4: 'pfGrid',
-			5: 'reactivepowerGrid',
-			6: 'voltagePV',
-			7: 'currentPV',
-			8: 'powerPV',
-			9: 'temperatureInverter',
-			10: 'modeInverter',
-			11: 'uptimeInverter',
-			12: 'electricityGeneration',
-			13: 'kiloGeneration',
-			14: 'megaGeneration',
-			15: 'gigaGeneration',
-			16: 'breakercountGrid',
-			17: 'breakercountPV'
-		}
-		# List of register addresses for each measurement
-		self.registerAddresses = {
-			1: 106,
-			2: 109,
-			3: 111,
-			4: 112,
-			5: 113,
-			6: 133,
-			7: 117,
-			8: 118,
-			9: 119,
-			10: 120,
-			11: 124,
-			12: 125,
-			13: 126,
-			14: 127,
-			15: 128,
-			16: 129,
-			17: 130
-		}
-		# List of division factors for each measurement
-		self.factors = {
-			1: 1,
-			2: 10,
-			3: 100,
-			4: 1,
-			5: 1,
-			6: 1,
-			7: 1,
-			8: 1,
-			9: 1,
-			10: 1,
-			11: 1,
-			12: 1,
-			13: 1,
-			14: 1,
-			15: 1,
-			16: 1,
-			17: 1
-		}
+		self.labels = dict((index + 1, point.label) for index, point in enumerate(profile.points))
+		# List of register addresses, and of register counts, for each measurement
+		self.registerAddresses = dict((index + 1, point.address) for index, point in enumerate(profile.points))
+		self.registerCounts = dict((index + 1, point.count) for index, point in enumerate(profile.points))
+		# Largest number of unused registers that may be read to merge two neighbouring reads into one
+		self.maximumGap = profile.maximumGap
+		# Largest number of registers that may be read in one transaction
+		self.maximumLength = profile.maximumLength
+		# List of block reads that cover every register address
+		self.blocks = []
+		# The decoder of the blocks into the values of the measurements, compiled on attach
+		self.decoder = None
 		# List of thresholds for each measurement
 		self.threshold = {}
-		# Space for storing modbusTCP device's file handle
+		# Lists of lower and upper bounds on each measurement, compiled from the thresholds
+		self.minimums = []
+		self.maximums = []
+		# Space for storing the device's file handle
 		self.handle = ''
-		# Space for receiving the body of a response message from the host
-		self.payload = []
+		# Space for receiving the body of a response message from the host, as the value of each measurement
+		self.payload = array.array('d', [0.0] * len(self.labels))
 		# Space for storing the time stamp from the last-received response message
 		self.timestmp = ''
-		# Space for storing the IP address of the host
-		self.IPAddress = ''
+		# List of flags indicating the validity of each measurement
+		self.validity = array.array('b', [0] * len(self.labels))
+		# The latest samples of the host
+		self.history = samples.sampleRing(len(self.labels))
 		# Flag indicating the validity of the measurement
 		self.sanity = -1
-	# A handler function to populate the URL of the host
-	def attach(self, identity):
-		self.threshold = identity['threshold']
-		self.IPAddress = identity['IPAddress']
-		self.handle = ModbusClient(host=self.IPAddress, auto_open=True)
+		# Flag indicating that the measurement has been retrieved
+		self.isMeasured = -1
+	# A handler function to compile the thresholds, the history, and the block reads of the host and their decoder, as every transport attaches
+	def attachProfile(self, identity):
+		self.setThreshold(identity['threshold'])
+		self.history = samples.sampleRing(len(self.labels), int(identity.get('historyDepth', samples.depthDefault)))
+		# The block read limits are optional
+		if 'maximumGap' in identity:
+			self.maximumGap = int(identity['maximumGap'])
+		if 'maximumLength' in identity:
+			self.maximumLength = int(identity['maximumLength'])
+		self.blocks = planRegisterBlocks(self.registerAddresses, self.maximumGap, self.maximumLength, self.registerCounts)
+		self.decoder = profiles.registerDecoder(self.profile.points, self.blocks)
+	# A handler function to compile the thresholds on the measurements, as when attaching or when they change
+	def setThreshold(self, threshold):
+		self.threshold = threshold
+		self.minimums, self.maximums = compileThresholds(self.labels, self.threshold, self.profile.isInclusive)
 	# A handler function to restore default settings
 	def detach(self):
-		self.payload = []
 		self.timestmp = ''
-		self.IPAddress = ''
+		self.blocks = []
+		self.decoder = None
 		self.handle = ''
 		self.sanity = -1
+		self.isMeasured = -1
 	# A method to retrieve measurements from the host
 	def measure(self):
 		self.timestmp = str(datetime.datetime.now())
-		for index in range(0, len(self.labels)):
-			registerData = float(self.handle.read_holding_registers(self.registerAddresses[index + 1], 1)[0]) / float(self.factors[index + 1])
-			self.payload.append(str(registerData))
-		self.sanity = 0
+		# Fetch each block of registers in a single transaction, and decode them into the measurements that they cover
+		self.decoder.decode(self.fetch(), self.payload)
+		self.conclude()
+	# A method to check every measurement against its thresholds at once, and keep the sample
+	def conclude(self):
+		with metrics.registry.timer('marshal_filter_seconds', model=self.profile.modelNumber):
+			checkThresholds(self.payload, self.minimums, self.maximums, self.validity)
+			self.sanity = self.filter()
+		self.isMeasured = 0
+		self.history.append(time.time(), self.payload, self.validity)
 	# A method to indicate useless measurements
 	def filter(self):
-		# For each measurement offered by the host,...
-		for index in range(0, len(self.labels)):
-			# Attempt to retrieve a threshold on the value of the measurement ...
-			try:
-				threshold = self.threshold[self.labels[index + 1]]
-			#  ... unless it doesn't exist ...
-			except KeyError:
-				# ... in which case, move on to the next measurement ...
-				pass
-			else:
-				# ... or otherwise, identify the type of filter, and check if the value of the measurement complies ...
-				if threshold['type'] == 'max':
-					if float(self.payload[index]) > float(threshold['value']):
-						return -1
-				if threshold['type'] == 'min':
-					if float(self.payload[index]) < float(threshold['value']):
-						return -1
-				if threshold['type'] == 'pass':
-					if float(self.payload[index]) >= float(threshold['valueMax']):
-						return -1
-					if float(self.payload[index]) <= float(threshold['valueMin']):
-						return -1
+		# If any measurement fails its thresholds, indicate so ...
+		if 0 in self.validity:
+			return -1
 		# ... if all comply, indicate so
 		return 0
 	# A method to parse response messages from the host and serve measurement values to the caller
 	def read(self, measurementIndex):
-		# Unless the existing measurement is valid, do not use it
-		if self.sanity != 0:
+		# Unless the existing measurement is current, do not use it
+		if self.isMeasured != 0:
 			self.measure()
-		# Unless the existing measurement is valuable, do not use it
-		self.sanity = self.filter()
 		return self.payload[measurementIndex - 1]
+	# A method to indicate if a measurement is valuable
+	def isValid(self, measurementIndex):
+		if self.isMeasured != 0:
+			self.measure()
+		return self.validity[measurementIndex - 1]
 	# Cancel the validity of the existing measurement
 	def cancel(self):
-		self.payload = []
 		self.sanity = -1
+		self.isMeasured = -1
 
-# Host interface for the "Statcon Energiaa SMB-096" Combiner
-class combinerSMB096(object):
-	# The constructor for the "Statcon Energiaa SMB-096" Combiner interface
-	def __init__(self):
-		super(combinerSMB096, self).__init__()
-		# List of all measurements offered by the host
-		self.labels = {
-			1: 'current1',
-			2: 'current2',
-			3: 'current3',
-			4: 'current4',
-			5: 'current5',
-			6: 'current6',
-			7: 'current7',
-			8: 'current8',
-			9: 'current9',
-			10: 'current10',
-			11: 'current11',
-			12: 'current12',
-			13: 'voltage_DC',
-			14: 'status_spd',
-			15: 'status_switch',
-			16: 'temperature_scb'
-		}
-		# List of division factors for each measurement
-		self.factors = {
-			1: 100,
-			2: 100,
-			3: 100,
-			4: 100,
-			5: 100,
-			6: 100,
-			7: 100,
-			8: 100,
-			9: 100,
-			10: 100,
-			11: 100,
-			12: 100,
-			13: 1,
-			14: 1,
-			15: 1,
-			16: 10
-		}
-		# List of thresholds for each measurement
-		self.threshold = {}
-		# Space for storing TTY device's file handle
-		self.handle = ''
-		# Space for receiving the body of a response message from the host
-		self.payload = []
-		# Space for storing the time stamp from the last-received response message
-		self.timestmp = ''
+# Host interface for any Modbus TCP host, such as the "ABB PVS800" Central Inverter, whose register map is given by its profile
+class deviceModbusTCP(deviceModbus):
+	# The constructor for a Modbus TCP host of a profile
+	def __init__(self, profile):
+		super(deviceModbusTCP, self).__init__(profile)
+		# The transport to use: 'pyModbusTCP', one blocking request at a time, or 'pipelined', on the shared event loop
+		self.transport = 'pyModbusTCP'
+		# Space for storing the blocks of registers received over the pipelined transport
+		self.registerBlocks = []
+		# Space for storing the IP address of the host
+		self.IPAddress = ''
+	# A handler function to populate the URL of the host
+	def attach(self, identity):
+		self.attachProfile(identity)
+		self.IPAddress = identity['IPAddress']
+		self.transport = identity.get('transport', self.transport)
+		if self.transport == 'pipelined':
+			self.handle = transport.reactor.connection(self.IPAddress, int(identity.get('port', transport.portDefault)), int(identity.get('unitId', transport.unitIdDefault)), float(identity.get('timeout', transport.timeoutDefault)), int(identity.get('pipeline', transport.pipelineDefault)))
+		else:
+			self.handle = common.importLibrary('pyModbusTCP.client').ModbusClient(host=self.IPAddress, port=int(identity.get('port', transport.portDefault)), auto_open=True)
+	# A handler function to restore default settings
+	def detach(self):
+		if self.transport == 'pipelined':
+			transport.reactor.release(self.handle.host, self.handle.port, self.handle.unitId)
+		super(deviceModbusTCP, self).detach()
+		self.IPAddress = ''
+	# A method to retrieve measurements from the host, along with every other host over the pipelined transport, if it is on it
+	def measure(self):
+		if self.transport == 'pipelined':
+			measurePipelined([self])
+			return
+		super(deviceModbusTCP, self).measure()
+	# A method to fetch each block of registers, one blocking request at a time
+	def fetch(self):
+		return [self.handle.read_holding_registers(registerAddress, registerCount) for registerAddress, registerCount, members in self.blocks]
+	# A method to queue a request for each block of registers on the shared event loop, without waiting for the responses
+	def submit(self):
+		self.timestmp = str(datetime.datetime.now())
+		self.registerBlocks = [None] * len(self.blocks)
+		for blockIndex, (registerAddress, registerCount, members) in enumerate(self.blocks):
+			self.handle.readHoldingRegisters(registerAddress, registerCount, lambda registerBlock, blockIndex=blockIndex: self.registerBlocks.__setitem__(blockIndex, registerBlock))
+	# A method to decode the blocks of registers received over the shared event loop into the measurements that they cover
+	def collect(self):
+		if None in self.registerBlocks:
+			# Unless every block arrived, no measurement is valuable
+			print 'Read Hardware Fail - ' + self.IPAddress + ' - No response'
+			for index in range(0, len(self.labels)):
+				self.payload[index] = -1.0
+				self.validity[index] = 0
+			self.sanity = -1
+			self.isMeasured = 0
+			return
+		self.decoder.decode(self.registerBlocks, self.payload)
+		self.conclude()
+
+# Host interface for any Modbus RTU slave on a shared serial bus, such as the "Statcon Energiaa SMB-096" Combiner, whose register map is given by its profile
+class deviceModbusRTU(deviceModbus):
+	# The constructor for a Modbus RTU slave of a profile
+	def __init__(self, profile):
+		super(deviceModbusRTU, self).__init__(profile)
+		# Space for storing the serial bus shared with other slaves on the same port
+		self.bus = ''
 		# Space for storing the port name of the host
 		self.portName = ''
 		# Space for storing the baudrate of the connection
 		self.baudrate = 0
 		# Space for storing the slave address of the host
 		self.slaveAddress = 0
-		# Flag indicating the validity of the measurement
-		self.sanity = -1
 	# A handler function to populate the URL of the host
 	def attach(self, identity):
-		self.threshold = identity['threshold']
+		self.attachProfile(identity)
 		self.portName = identity['portName']
 		self.baudrate = identity['baudrate']
 		self.slaveAddress = int(identity['slaveAddress'])
-		minimalmodbus.BAUDRATE = int(self.baudrate)
-		self.handle = minimalmodbus.Instrument(self.portName, self.slaveAddress)
+		self.bus = attachBus(self.portName, int(self.baudrate))
+		self.handle = self.bus.handle
 	# A handler function to restore default settings
 	def detach(self):
-		self.payload = []
-		self.timestmp = ''
+		if self.bus != '':
+			detachBus(self.portName)
+		super(deviceModbusRTU, self).detach()
 		self.portName = ''
 		self.baudrate = 0
 		self.slaveAddress = 0
-		self.handle = ''
-		self.sanity = -1
-	# A method to retrieve measurements from the host
-	def measure(self):
-		self.timestmp = str(datetime.datetime.now())
-		for index in range(0, len(self.labels)):
-			registerAddress = index
-			registerData = float(self.handle.read_register(registerAddress, functioncode = 3)) / float(self.factors[index + 1])
-			self.payload.append(str(registerData))
-		self.sanity = 0
-	# A method to indicate useless measurements
-	def filter(self):
-		# For each measurement offered by the host,...
-		for index in range(0, len(self.labels)):
-			# Attempt to retrieve a threshold on the value of the measurement ...
-			try:
-				threshold = self.threshold[self.labels[index + 1]]
-			#  ... unless it doesn't exist ...
-			except KeyError:
-				# ... in which case, move on to the next measurement ...
-				pass
-			else:
-				# ... or otherwise, identify the type of filter, and check if the value of the measurement complies ...
-				if threshold['type'] == 'max':
-					if float(self.payload[index]) >= float(threshold['value']):
-						return -1
-				if threshold['type'] == 'min':
-					if float(self.payload[index]) <= float(threshold['value']):
-						return -1
-				if threshold['type'] == 'pass':
-					if float(self.payload[index]) >= float(threshold['valueMax']):
-						return -1
-					if float(self.payload[index]) <= float(threshold['valueMin']):
-						return -1
-		# ... if all comply, indicate so
-		return 0
-	# A method to parse response messages from the host and serve measurement values to the caller
-	def read(self, measurementIndex):
-		# Unless the existing measurement is valid, do not use it
-		if self.sanity != 0:
-			self.measure()
-		# Unless the existing measurement is valuable, do not use it
-		self.sanity = self.filter()
-		return self.payload[measurementIndex - 1]
-	# Cancel the validity of the existing measurement
-	def cancel(self):
-		self.payload = []
-		self.sanity = -1
+		self.bus = ''
+	# A method to fetch each block of registers in a single frame on the shared bus
+	def fetch(self):
+		return [self.bus.readRegisters(self.slaveAddress, registerAddress, registerCount) for registerAddress, registerCount, members in self.blocks]
 
 # Host interface for the "SMA Sunny Web Box" Logger
 class loggerSunnyWebBox(object):
-	# The constructor for the "SMA Sunny Web Box" Logger interface
-	def __init__(self):
+	# The constructor for the "SMA Sunny Web Box" Logger interface, whose measurements are parsed off its web pages rather than given by its profile
+	def __init__(self, profile):
 		super(loggerSunnyWebBox, self).__init__()
+		# The profile of the host
+		self.profile = profile
 		# List of all measurements offered by the host
 		self.labels = {
 			0: 'power_D',
 			1: 'energyToday_D',
 			2: 'energyCumulative_D'
 		}
-		# Space for receiving the body of a response message from the host
-		self.payload = []
+		# List of the names of each measurement on the host's home page
+		self.names = {
+			'Power': 0,
+			'DailyYield': 1,
+			'TotalYield': 2
+		}
+		# List of the names of each measurement in the host's RPC interface
+		self.metas = {
+			'GriPwr': 0,
+			'GriEgyTdy': 1,
+			'GriEgyTot': 2
+		}
+		# List of multiplication factors for each unit of each measurement, into W, kWh and GWh respectively
+		self.factors = {
+			0: {'W': 1.0, 'kW': 1000.0, 'MW': 1000000.0},
+			1: {'Wh': 0.001, 'kWh': 1.0, 'MWh': 1000.0, 'GWh': 1000000.0},
+			2: {'Wh': 0.000000001, 'kWh': 0.000001, 'MWh': 0.001, 'GWh': 1.0}
+		}
+		# A pattern that picks the name, value and unit of every measurement off the home page in a single pass
+		self.pattern = re.compile(r'(Power|DailyYield|TotalYield)"[^>]*>\s*([-+]?[0-9]*\.?[0-9]+)\s*([kMG]?Wh?)\s*<')
+		# Space for receiving the body of a response message from the host, as the value of each measurement
+		self.payload = array.array('d', [0.0] * len(self.labels))
 		# Space for storing the time stamp from the last-received response message
 		self.timestmp = ''
 		# Space for storing the URL of the host
 		self.address = ''
+		# The interface to use: 'rpc', 'html', or 'auto' to try the RPC interface and fall back to the home page
+		self.interface = 'auto'
+		# Interval to wait for a response from the host, in seconds
+		self.timeout = 5.0
+		# Space for storing the HTTP session kept alive with the host
+		self.session = ''
+		# List of flags indicating the validity of each measurement
+		self.validity = array.array('b', [0] * len(self.labels))
+		# The latest samples of the host
+		self.history = samples.sampleRing(len(self.labels))
 		# Flag indicating the validity of the measurement
 		self.sanity = -1
 	# A handler function to populate the URL of the host
 	def attach(self, identity):
 		self.address = identity['address']
+		self.interface = identity.get('interface', 'auto')
+		self.timeout = float(identity.get('timeout', self.timeout))
+		self.history = samples.sampleRing(len(self.labels), int(identity.get('historyDepth', samples.depthDefault)))
+		self.session = common.importLibrary('requests').Session()
+		# Ask the host and any proxy on the way for a fresh page every time
+		self.session.headers['Cache-Control'] = 'no-cache'
+	# A handler function to compile the thresholds on the measurements, of which the host has none
+	def setThreshold(self, threshold):
+		pass
 	# A handler function to restore default settings
 	def detach(self):
-		self.payload = []
+		if self.session != '':
+			self.session.close()
 		self.timestmp = ''
 		self.address = ''
+		self.session = ''
 		self.sanity = -1
+	# A method to fetch the value and unit of each measurement over the RPC interface, or None unless it is offered
+	def measureRPC(self):
+		response = self.session.post(self.address + 'rpc', data={'RPC': '{"version":"1.0","proc":"GetPlantOverview","id":"1","format":"JSON"}'}, timeout=self.timeout)
+		# A host without the RPC interface has no such page, or answers with something other than an overview ...
+		if response.status_code == 404:
+			return None
+		# ... while any other error, as of the network, fails this measurement alone
+		response.raise_for_status()
+		try:
+			return [(self.metas[channel['meta']], channel['value'], channel['unit']) for channel in response.json()['result']['overview'] if channel.get('meta') in self.metas]
+		except (ValueError, KeyError, TypeError, AttributeError):
+			return None
+	# A method to fetch the value and unit of each measurement off the home page
+	def measureHTML(self):
+		text = self.session.get(self.address + 'home.htm', timeout=self.timeout).text
+		return [(self.names[match.group(1)], match.group(2), match.group(3)) for match in self.pattern.finditer(text)]
 	# A method to retrieve measurements from the host
 	def measure(self):
 		self.timestmp = str(datetime.datetime.now())
-		# try ... except here
-		text = requests.get(self.address + 'home.htm?saltpepper=' + self.timestmp).text
-		subtext = text
-		subtext = subtext[subtext.find('Power\"'):]
-		subtext = subtext[subtext.find('>') + 1:]
-		if subtext[subtext.find(' ') + 1:subtext.find('<')] == 'kW':
-			self.payload.append(str(float(subtext[:subtext.find(' ')]) * 1000.0))
-		elif subtext[subtext.find(' ') + 1:subtext.find('<')] == 'W':
-			self.payload.append(str(float(subtext[:subtext.find(' ')])))
-		subtext = subtext[subtext.find('DailyYield\"'):]
-		subtext = subtext[subtext.find('>') + 1:]
-		if subtext[subtext.find(' ') + 1:subtext.find('<')] == 'kWh':
-			self.payload.append(str(float(subtext[:subtext.find(' ')])))
-		elif subtext[subtext.find(' ') + 1:subtext.find('<')] == 'Wh':
-			self.payload.append(str(float(subtext[:subtext.find(' ')]) / 1000.0))
-		elif subtext[subtext.find(' ') + 1:subtext.find('<')] == 'MWh':
-			self.payload.append(str(float(subtext[:subtext.find(' ')]) * 1000.0))
-		subtext = subtext[subtext.find('TotalYield\"'):]
-		subtext = subtext[subtext.find('>') + 1:]
-		if subtext[subtext.find(' ') + 1:subtext.find('<')] == 'MWh':
-			self.payload.append(str(float(subtext[:subtext.find(' ')]) / 1000.0))
-		elif subtext[subtext.find(' ') + 1:subtext.find('<')] == 'GWh':
-			self.payload.append(str(float(subtext[:subtext.find(' ')])))
+		# Prefer the RPC interface, and stop trying it once the host turns out not to offer it
+		channels = None
+		if self.interface != 'html':
+			channels = self.measureRPC()
+			if (channels is None) and (self.interface == 'auto'):
+				self.interface = 'html'
+		if channels is None:
+			channels = self.measureHTML()
+		# Every measurement that was found, in a recognized unit, is valid
+		for index in range(0, len(self.labels)):
+			self.payload[index] = -1.0
+			self.validity[index] = 0
+		for index, value, unit in channels:
+			if unit in self.factors[index]:
+				self.payload[index] = float(value) * self.factors[index][unit]
+				self.validity[index] = 1
 		self.sanity = 0
+		self.history.append(time.time(), self.payload, self.validity)
 	# A method to parse response messages from the host and serve measurement values to the caller
 	def read(self, measurementIndex):
 		# Unless the existing measurement is valid, do not use it
 		if self.sanity != 0:
 			self.measure()
 		return self.payload[measurementIndex]
+	# A method to indicate if a measurement is valuable
+	def isValid(self, measurementIndex):
+		if self.sanity != 0:
+			self.measure()
+		return self.validity[measurementIndex]
 	# Cancel the validity of the existing measurement
 	def cancel(self):
-		self.payload = []
 		self.sanity = -1
@@ -0,0 +1,408 @@
+# Aid data exchange
+import json
+# Handle files and directories of the historian
+import os
+# Pack timestamps and floats into their bits, and the headers of chunks
+import struct
+# Handle dates and intervals
+import time
+# Handle missing values
+import math
+# Serialize the acquisition loop that writes and the clients that query
+import threading
+
+# Number of samples of a host held in memory before they are written as one chunk, unless the historian specifies one
+chunkSizeDefault = 3600
+# Interval after which a chunk is written however few samples it holds, in seconds, unless the historian specifies one
+flushIntervalDefault = 3600.0
+# Number of days of files to keep, or 0 to keep every one, unless the historian specifies one
+retentionDaysDefault = 0
+
+# The mark at the start of every chunk, and the layout of its header: the mark, the times of the first and last samples, in milliseconds since the epoch, the number of samples, and the number of columns of values
+chunkMark = 'GRL1'
+chunkHeader = struct.Struct('>4sQQIH')
+# The buckets of the differences between consecutive intervals between timestamps, in milliseconds: the prefix of each, its width, the width of the difference, and the smallest difference that it holds
+timeBuckets = ((0b10, 2, 7, -63), (0b110, 3, 9, -255), (0b1110, 4, 12, -2047))
+
+# A class to write a stream of bits into bytes
+class bitWriter(object):
+	# The constructor for the bitWriter class
+	def __init__(self):
+		super(bitWriter, self).__init__()
+		# The complete bytes, and the bits yet to fill a byte, with their number
+		self.data = bytearray()
+		self.accumulator = 0
+		self.count = 0
+	# A method to write the lowest bits of a value, most significant first
+	def write(self, value, width):
+		self.accumulator = (self.accumulator << width) | (value & ((1 << width) - 1))
+		self.count += width
+		while self.count >= 8:
+			self.count -= 8
+			self.data.append((self.accumulator >> self.count) & 0xFF)
+		self.accumulator &= (1 << self.count) - 1
+	# A method to return the bytes written so far, padding the last one with zeroes, without closing the stream
+	def getvalue(self):
+		if self.count:
+			return str(self.data) + chr((self.accumulator << (8 - self.count)) & 0xFF)
+		return str(self.data)
+
+# A class to read a stream of bits from bytes
+class bitReader(object):
+	# The constructor for the bitReader class
+	def __init__(self, data):
+		super(bitReader, self).__init__()
+		self.data = bytearray(data)
+		# The position of the next bit
+		self.position = 0
+	# A method to read a number of bits as an unsigned value
+	def read(self, width):
+		value = 0
+		while width > 0:
+			offset = self.position & 7
+			taken = min(8 - offset, width)
+			value = (value << taken) | ((self.data[self.position >> 3] >> (8 - offset - taken)) & ((1 << taken) - 1))
+			self.position += taken
+			width -= taken
+		return value
+
+# A class to compress a column of timestamps, in milliseconds, by the differences between consecutive intervals, which are nil for samples at regular intervals
+class timeEncoder(object):
+	# The constructor for the timeEncoder class
+	def __init__(self):
+		super(timeEncoder, self).__init__()
+		self.bits = bitWriter()
+		self.count = 0
+		# The latest timestamp, and the interval that led to it
+		self.previous = 0
+		self.interval = 0
+	# A method to add a timestamp
+	def add(self, timestmp):
+		if self.count == 0:
+			self.bits.write(timestmp, 64)
+		else:
+			interval = timestmp - self.previous
+			difference = interval - self.interval
+			self.interval = interval
+			if difference == 0:
+				self.bits.write(0, 1)
+			else:
+				for prefix, prefixWidth, width, minimum in timeBuckets:
+					if minimum <= difference <= minimum + (1 << width) - 1:
+						self.bits.write(prefix, prefixWidth)
+						self.bits.write(difference - minimum, width)
+						break
+				else:
+					self.bits.write(0b1111, 4)
+					self.bits.write(difference, 64)
+		self.previous = timestmp
+		self.count += 1
+
+# A function to decompress a column of a number of timestamps
+def decodeTimes(data, count):
+	reader = bitReader(data)
+	timestmps = []
+	previous = 0
+	interval = 0
+	for sampleIndex in range(0, count):
+		if sampleIndex == 0:
+			previous = reader.read(64)
+		else:
+			# Count the leading ones of the prefix, up to four, to find the bucket of the difference
+			ones = 0
+			while (ones < 4) and reader.read(1):
+				ones += 1
+			if ones == 0:
+				difference = 0
+			elif ones < 4:
+				prefix, prefixWidth, width, minimum = timeBuckets[ones - 1]
+				difference = reader.read(width) + minimum
+			else:
+				difference = reader.read(64)
+				if difference >= (1 << 63):
+					difference -= 1 << 64
+			interval += difference
+			previous += interval
+		timestmps.append(previous)
+	return timestmps
+
+# A class to compress a column of values by the bits that differ from the previous value, which are none for a value that holds
+class valueEncoder(object):
+	# The constructor for the valueEncoder class
+	def __init__(self):
+		super(valueEncoder, self).__init__()
+		self.bits = bitWriter()
+		self.count = 0
+		# The bits of the latest value, and the numbers of leading and trailing zeroes of the latest window of differing bits, or -1 before the first
+		self.previous = 0
+		self.leading = -1
+		self.trailing = 0
+	# A method to add a value
+	def add(self, value):
+		current = struct.unpack('>Q', struct.pack('>d', value))[0]
+		if self.count == 0:
+			self.bits.write(current, 64)
+		else:
+			xor = current ^ self.previous
+			if xor == 0:
+				self.bits.write(0, 1)
+			else:
+				leading = min(64 - xor.bit_length(), 31)
+				trailing = (xor & -xor).bit_length() - 1
+				# Reuse the latest window if the differing bits fit in it ...
+				if (self.leading >= 0) and (leading >= self.leading) and (trailing >= self.trailing):
+					self.bits.write(0b10, 2)
+					self.bits.write(xor >> self.trailing, 64 - self.leading - self.trailing)
+				# ... or else, describe a new one, whose width of 64 is written as 0
+				else:
+					width = 64 - leading - trailing
+					self.bits.write(0b11, 2)
+					self.bits.write(leading, 5)
+					self.bits.write(width & 63, 6)
+					self.bits.write(xor >> trailing, width)
+					self.leading = leading
+					self.trailing = trailing
+		self.previous = current
+		self.count += 1
+
+# A function to decompress a column of a number of values
+def decodeValues(data, count):
+	reader = bitReader(data)
+	values = []
+	previous = 0
+	leading = 0
+	trailing = 0
+	for sampleIndex in range(0, count):
+		if sampleIndex == 0:
+			previous = reader.read(64)
+		elif reader.read(1):
+			if reader.read(1):
+				leading = reader.read(5)
+				width = reader.read(6) or 64
+				trailing = 64 - leading - width
+			previous ^= reader.read(64 - leading - trailing) << trailing
+		values.append(struct.unpack('>d', struct.pack('>Q', previous))[0])
+	return values
+
+# A class to collect the samples of a host into one chunk, compressed column by column as they arrive
+class chunkWriter(object):
+	# The constructor for the chunkWriter class
+	def __init__(self, names):
+		super(chunkWriter, self).__init__()
+		# The names of the columns of values
+		self.names = list(names)
+		# The column of timestamps, and one column per name
+		self.times = timeEncoder()
+		self.columns = [valueEncoder() for name in self.names]
+		# The times of the first and last samples, in milliseconds, and the time at which the chunk was opened
+		self.timeStart = 0
+		self.timeEnd = 0
+		self.timeOpened = time.time()
+	# A method to add a sample: a timestamp, in milliseconds, and a value per column, as NaN where it is not valuable
+	def add(self, timestmp, values):
+		if self.times.count == 0:
+			self.timeStart = timestmp
+		self.timeEnd = timestmp
+		self.times.add(timestmp)
+		for column, value in zip(self.columns, values):
+			column.add(value)
+	# A method to count the samples in the chunk
+	def count(self):
+		return self.times.count
+	# A method to encode the chunk: its header, the names of its columns, the length of each column, and the columns, timestamps first
+	def encode(self):
+		names = json.dumps(self.names)
+		columns = [self.times.bits.getvalue()] + [column.bits.getvalue() for column in self.columns]
+		return chunkHeader.pack(chunkMark, self.timeStart, self.timeEnd, self.times.count, len(self.names)) + struct.pack('>I', len(names)) + names + struct.pack('>%dI' % len(columns), *[len(column) for column in columns]) + ''.join(columns)
+
+# A function to read the chunks of a file whose samples fall within a range of times, in milliseconds, decoding only the columns asked for; a chunk torn by a loss of power ends the file
+def readChunks(filename, timeStart, timeEnd, names=None):
+	chunks = []
+	with open(filename, 'rb') as filehandle:
+		while True:
+			header = filehandle.read(chunkHeader.size + 4)
+			if len(header) < chunkHeader.size + 4:
+				break
+			mark, chunkStart, chunkEnd, count, columnCount = chunkHeader.unpack(header[:chunkHeader.size])
+			if mark != chunkMark:
+				break
+			columnNames = json.loads(filehandle.read(struct.unpack('>I', header[chunkHeader.size:])[0]))
+			lengths = struct.unpack('>%dI' % (columnCount + 1), filehandle.read(4 * (columnCount + 1)))
+			offset = filehandle.tell()
+			if offset + sum(lengths) > os.fstat(filehandle.fileno()).st_size:
+				break
+			# Skip every column of a chunk out of range, and the columns not asked for of one in range
+			if (chunkEnd >= timeStart) and (chunkStart <= timeEnd):
+				timestmps = decodeTimes(filehandle.read(lengths[0]), count)
+				columns = {}
+				for name, length in zip(columnNames, lengths[1:]):
+					if (names is None) or (name in names):
+						columns[name] = decodeValues(filehandle.read(length), count)
+					else:
+						filehandle.seek(length, os.SEEK_CUR)
+				chunks.append((timestmps, columns))
+			filehandle.seek(offset + sum(lengths))
+	return chunks
+
+# A function to measure the complete chunks at the start of a file, in bytes, so that a chunk torn by a loss of power can be cut off
+def measureChunks(filename):
+	size = 0
+	with open(filename, 'rb') as filehandle:
+		fileSize = os.fstat(filehandle.fileno()).st_size
+		while True:
+			header = filehandle.read(chunkHeader.size + 4)
+			if (len(header) < chunkHeader.size + 4) or (header[:4] != chunkMark):
+				break
+			columnCount = chunkHeader.unpack(header[:chunkHeader.size])[4]
+			filehandle.seek(struct.unpack('>I', header[chunkHeader.size:])[0], os.SEEK_CUR)
+			lengths = filehandle.read(4 * (columnCount + 1))
+			if len(lengths) < 4 * (columnCount + 1):
+				break
+			end = filehandle.tell() + sum(struct.unpack('>%dI' % (columnCount + 1), lengths))
+			if end > fileSize:
+				break
+			size = end
+			filehandle.seek(end)
+	return size
+
+# A class to keep the history of the measurements of each host in compressed, append-only files of chunks, a file per host and day
+class historian(object):
+	# The constructor for the historian class
+	def __init__(self, directory, chunkSize=chunkSizeDefault, flushInterval=flushIntervalDefault, retentionDays=retentionDaysDefault):
+		super(historian, self).__init__()
+		# Space for storing the directory of the files, a directory per host
+		self.directory = directory
+		# The number of samples, and the interval, after which a chunk is written
+		self.chunkSize = chunkSize
+		self.flushInterval = flushInterval
+		# The number of days of files to keep
+		self.retentionDays = retentionDays
+		# A dictionary of the chunks being collected, and of the time of the latest sample, against the keys of their hosts
+		self.chunks = {}
+		self.timesLatest = {}
+		# The files checked for torn chunks since this process started
+		self.checked = set()
+		# Lock that lets only one thread at a time touch the chunks and the files
+		self.lock = threading.Lock()
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+	# A method to name the file of a host for the day of a time, in milliseconds
+	def fileName(self, key, timestmp):
+		return os.path.join(self.directory, key, time.strftime('%Y-%m-%d', time.gmtime(timestmp // 1000)) + '.chunks')
+	# A method to add a sample of a host: the names of its measurements, the time at which it was taken, in seconds since the epoch, and the value and validity of each measurement
+	def append(self, key, names, timeSample, values, validity):
+		timestmp = int(round(timeSample * 1000))
+		with self.lock:
+			# A sample already kept, as of a host that was not measured again, is kept just once
+			if timestmp <= self.timesLatest.get(key, -1):
+				return
+			self.timesLatest[key] = timestmp
+			chunk = self.chunks.get(key)
+			# A chunk holds the samples of one day, under one list of names
+			if (chunk is not None) and ((chunk.names != list(names)) or (self.fileName(key, chunk.timeStart) != self.fileName(key, timestmp))):
+				self.write(key)
+				chunk = None
+			if chunk is None:
+				chunk = self.chunks[key] = chunkWriter(names)
+			chunk.add(timestmp, [value if isValid else float('nan') for value, isValid in zip(values, validity)])
+			if (chunk.count() >= self.chunkSize) or (time.time() - chunk.timeOpened >= self.flushInterval):
+				self.write(key)
+	# A method to append the chunk of a host to its file in one sequential write, which survives a loss of power once this returns
+	def write(self, key):
+		chunk = self.chunks.pop(key, None)
+		if (chunk is None) or (chunk.count() == 0):
+			return
+		filename = self.fileName(key, chunk.timeStart)
+		if not os.path.isdir(os.path.dirname(filename)):
+			os.makedirs(os.path.dirname(filename))
+		# Cut off a chunk torn by a loss of power, just once per file
+		if (filename not in self.checked) and os.path.exists(filename):
+			size = measureChunks(filename)
+			if size < os.path.getsize(filename):
+				with open(filename, 'rb+') as filehandle:
+					filehandle.truncate(size)
+		self.checked.add(filename)
+		with open(filename, 'ab') as filehandle:
+			filehandle.write(chunk.encode())
+			filehandle.flush()
+			os.fsync(filehandle.fileno())
+		self.prune(key)
+	# A method to delete the files of a host older than the days to keep
+	def prune(self, key):
+		if self.retentionDays <= 0:
+			return
+		oldest = time.strftime('%Y-%m-%d', time.gmtime(time.time() - self.retentionDays * 86400)) + '.chunks'
+		directory = os.path.join(self.directory, key)
+		for filename in os.listdir(directory):
+			if filename.endswith('.chunks') and (filename < oldest):
+				os.remove(os.path.join(directory, filename))
+	# A method to write the chunk of every host, as when stopping
+	def flush(self):
+		with self.lock:
+			for key in self.chunks.keys():
+				self.write(key)
+	# A method to write the chunk of every host and stop
+	def close(self):
+		self.flush()
+	# A method to list the keys of the hosts with a history
+	def hosts(self):
+		with self.lock:
+			keys = set(self.chunks.keys())
+		return sorted(keys | set(key for key in os.listdir(self.directory) if os.path.isdir(os.path.join(self.directory, key))))
+	# A method to query the history of a host over a range of times, in seconds since the epoch, as a list of names and a list of rows, each as a time and a value per name, or None where it was not valuable; given a step, in seconds, the rows are the means of the samples over each step instead
+	def query(self, key, timeStart, timeEnd, names=None, step=None):
+		# A key names a directory of the historian, and nothing beyond it
+		if (os.sep in key) or key.startswith('.'):
+			raise ValueError('Unknown host ' + key)
+		# A step is a positive, finite number of seconds
+		if (step is not None) and not (0 < step < float('inf')):
+			raise ValueError('Invalid step ' + str(step))
+		timeStart = int(timeStart * 1000)
+		timeEnd = int(timeEnd * 1000)
+		chunks = []
+		# Read the files of the days in range, and then the chunk being collected, in memory
+		directory = os.path.join(self.directory, key)
+		if os.path.isdir(directory):
+			first = os.path.basename(self.fileName(key, timeStart))
+			last = os.path.basename(self.fileName(key, timeEnd))
+			for filename in sorted(os.listdir(directory)):
+				if filename.endswith('.chunks') and (first <= filename <= last):
+					chunks.extend(readChunks(os.path.join(directory, filename), timeStart, timeEnd, names))
+		with self.lock:
+			chunk = self.chunks.get(key)
+			if (chunk is not None) and (chunk.count() > 0) and (chunk.timeEnd >= timeStart) and (chunk.timeStart <= timeEnd):
+				columns = dict((name, decodeValues(column.bits.getvalue(), column.count)) for name, column in zip(chunk.names, chunk.columns) if (names is None) or (name in names))
+				chunks.append((decodeTimes(chunk.times.bits.getvalue(), chunk.times.count), columns))
+		# Unless asked for some, every name of any chunk in range is returned
+		if names is None:
+			names = sorted(set(name for timestmps, columns in chunks for name in columns.keys()))
+		rows = []
+		for timestmps, columns in chunks:
+			for sampleIndex, timestmp in enumerate(timestmps):
+				if timeStart <= timestmp <= timeEnd:
+					rows.append((timestmp / 1000.0, [columns[name][sampleIndex] if name in columns else float('nan') for name in names]))
+		rows.sort(key=lambda row: row[0])
+		if step is not None:
+			rows = downsample(rows, len(names), step)
+		return names, [(timeRow, [None if math.isnan(value) else value for value in values]) for timeRow, values in rows]
+
+# A function to summarize rows of samples as the means of their valuable values over steps of a width, in seconds, aligned to the epoch, each row starting its step
+def downsample(rows, width, step):
+	summaries = []
+	timeStep = None
+	sums = [0.0] * width
+	counts = [0] * width
+	for timeRow, values in rows + [(None, None)]:
+		timeRowStep = math.floor(timeRow / step) * step if timeRow is not None else None
+		if (timeStep is not None) and (timeRowStep != timeStep):
+			summaries.append((timeStep, [sums[index] / counts[index] if counts[index] else float('nan') for index in range(0, width)]))
+			sums = [0.0] * width
+			counts = [0] * width
+		if timeRow is None:
+			break
+		timeStep = timeRowStep
+		for index, value in enumerate(values):
+			if not math.isnan(value):
+				sums[index] += value
+				counts[index] += 1
+	return summaries
@@ -0,0 +1,157 @@
+# Aid data exchange
+import json
+# Handle files and directories of the journal
+import os
+# Handle threads of this process
+import threading
+
+# Size, in bytes, beyond which a segment of the journal is closed and a new one opened
+segmentSizeDefault = 1048576
+# Number of records to replay in one request, unless the journal specifies one
+batchSizeDefault = 500
+# Interval between attempts to replay the journal, in seconds, unless the journal specifies one
+intervalDefault = 30.0
+
+# A class to represent a durable, append-only journal of payloads awaiting despatch to one server
+class journal(object):
+	# The constructor for the journal class
+	def __init__(self, directory, segmentSize=segmentSizeDefault):
+		super(journal, self).__init__()
+		# Space for storing the directory of the journal's files
+		self.directory = directory
+		# Size beyond which a segment is closed
+		self.segmentSize = segmentSize
+		# Lock that lets only one thread at a time touch the journal's files
+		self.lock = threading.Lock()
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		# The numbers of all segments, oldest first, each named after its number
+		self.segments = sorted(int(filename[:-4]) for filename in os.listdir(directory) if filename.endswith('.log'))
+		if not self.segments:
+			self.segments = [0]
+		# The position of the oldest record yet to be replayed, as a segment number and a byte offset
+		try:
+			with open(os.path.join(directory, 'cursor')) as filehandle:
+				self.cursor = tuple(json.load(filehandle))
+		except (IOError, ValueError):
+			self.cursor = (self.segments[0], 0)
+		# Discard a record torn by a loss of power while it was being written
+		filename = self.segmentName(self.segments[-1])
+		if os.path.exists(filename):
+			with open(filename, 'rb+') as filehandle:
+				content = filehandle.read()
+				if content and not content.endswith('\n'):
+					filehandle.truncate(content.rfind('\n') + 1)
+	# A method to name the file of a segment
+	def segmentName(self, segment):
+		return os.path.join(self.directory, '%010d.log' % segment)
+	# A method to append a record, which survives a loss of power once this returns
+	def append(self, record):
+		with self.lock:
+			filename = self.segmentName(self.segments[-1])
+			with open(filename, 'ab') as filehandle:
+				filehandle.write(json.dumps(record) + '\n')
+				filehandle.flush()
+				os.fsync(filehandle.fileno())
+				size = filehandle.tell()
+			# Open a new segment once this one is large enough
+			if size >= self.segmentSize:
+				self.segments.append(self.segments[-1] + 1)
+	# A method to check if there are records yet to be replayed
+	def backlog(self):
+		with self.lock:
+			if self.cursor[0] != self.segments[-1]:
+				return True
+			filename = self.segmentName(self.segments[-1])
+			return os.path.exists(filename) and os.path.getsize(filename) > self.cursor[1]
+	# A method to measure the records yet to be replayed, in bytes
+	def size(self):
+		with self.lock:
+			size = 0
+			for segment in self.segments:
+				filename = self.segmentName(segment)
+				if (segment >= self.cursor[0]) and os.path.exists(filename):
+					size += os.path.getsize(filename)
+			return max(0, size - self.cursor[1])
+	# A method to read up to a number of the oldest records yet to be replayed, and the position that follows them
+	def read(self, count):
+		records = []
+		with self.lock:
+			segment, offset = self.cursor
+			while len(records) < count:
+				filename = self.segmentName(segment)
+				if os.path.exists(filename):
+					with open(filename, 'rb') as filehandle:
+						filehandle.seek(offset)
+						while len(records) < count:
+							line = filehandle.readline()
+							if not line.endswith('\n'):
+								break
+							offset += len(line)
+							# Skip whatever cannot be parsed, rather than block the journal on it
+							try:
+								records.append(json.loads(line))
+							except ValueError:
+								pass
+				# Move on to the next segment, if this one is exhausted and closed
+				if len(records) < count and segment < self.segments[-1]:
+					segment, offset = segment + 1, 0
+				else:
+					break
+		return records, (segment, offset)
+	# A method to mark every record before a position as replayed, and delete the segments left behind
+	def commit(self, position):
+		with self.lock:
+			filename = os.path.join(self.directory, 'cursor')
+			with open(filename + '.tmp', 'wb') as filehandle:
+				json.dump(list(position), filehandle)
+				filehandle.flush()
+				os.fsync(filehandle.fileno())
+			os.rename(filename + '.tmp', filename)
+			self.cursor = tuple(position)
+			while self.segments[0] < self.cursor[0]:
+				if os.path.exists(self.segmentName(self.segments[0])):
+					os.remove(self.segmentName(self.segments[0]))
+				self.segments.pop(0)
+
+# A class to replay the journal of a server in batches whenever the server can be reached
+class drainer(threading.Thread):
+	# The constructor for the drainer class
+	def __init__(self, backlog, sink, batchSize=batchSizeDefault, interval=intervalDefault):
+		super(drainer, self).__init__()
+		self.daemon = True
+		# The journal to replay
+		self.backlog = backlog
+		# The server to replay it to
+		self.sink = sink
+		# Number of records in one request
+		self.batchSize = batchSize
+		# Interval between attempts
+		self.interval = interval
+		# Flag to stop the thread
+		self.stopEvent = threading.Event()
+	# A method to replay batches until the journal is empty, the server fails, a number of batches is reached, or the thread is stopped
+	def drain(self, batchCount=None):
+		while ((batchCount is None) or (batchCount > 0)) and not self.stopEvent.is_set():
+			records, position = self.backlog.read(self.batchSize)
+			if not records:
+				if position != self.backlog.cursor:
+					self.backlog.commit(position)
+				return 0
+			if self.sink.postBulk(records) is None:
+				return -1
+			self.backlog.commit(position)
+			if batchCount is not None:
+				batchCount -= 1
+		return 0
+	# A method to keep replaying the journal until stopped
+	def run(self):
+		while not self.stopEvent.is_set():
+			try:
+				self.drain()
+			except Exception as error:
+				print 'Drain Journal Fail - ' + str(error)
+			self.stopEvent.wait(self.interval)
+	# A method to stop the thread
+	def stop(self):
+		self.stopEvent.set()
@@ -0,0 +1,189 @@
+# Aid data exchange
+import json
+# Handle threads of this process
+import threading
+# Tag each version of the snapshot
+import time
+# Render the web page as the other pages of the Raspberry Pi are, and import the HTTP server only once the snapshot is served
+import common
+
+# Format and parse the dates of conditional requests, once the snapshot is served
+email = None
+# Escape the names and values in the web page, once the snapshot is served
+cgi = None
+# Parse the queries of the history, once the snapshot is served
+urlparse = None
+# Serve the snapshot over HTTP, to many clients at once, once asked to
+BaseHTTPServer = None
+SocketServer = None
+
+# Address on which the server listens, unless the configuration specifies one
+addressDefault = '127.0.0.1'
+
+# A class to keep the latest values of the measurements of every host, and of the parameters of the Raspberry Pi, as published by the acquisition loop, rendered only when first asked for
+class latestSnapshot(object):
+	# The constructor for the latestSnapshot class
+	def __init__(self):
+		super(latestSnapshot, self).__init__()
+		# The time of the latest acquisition, as text, and in seconds since the epoch
+		self.timestmp = ''
+		self.timePublished = 0.0
+		# A list of hosts, each as a key, the description of the host, and a dictionary of the value and validity of each of its measurements, against their names
+		self.hosts = []
+		# A dictionary of the values of the parameters of the Raspberry Pi, against their names
+		self.parameters = {}
+		# The number of the latest version, tagged by the time at which this process started, so that no tag repeats across restarts
+		self.version = 0
+		self.tag = '%x' % int(time.time())
+		# A dictionary of the rendered bodies of the latest version, against their formats
+		self.bodies = {}
+		# Lock that keeps readers off the snapshot while it is published
+		self.lock = threading.Lock()
+	# A method to publish the values of the measurements acquired in a cycle, keeping the values last published of those that were not
+	def publish(self, timestmp, hosts, parameters):
+		with self.lock:
+			previous = dict((key, measurements) for key, hostData, measurements in self.hosts)
+			self.hosts = []
+			for key, hostData, measurements in hosts:
+				merged = dict(previous.get(key, {}))
+				merged.update(measurements)
+				self.hosts.append((key, hostData, merged))
+			self.parameters = parameters
+			self.timestmp = timestmp
+			self.timePublished = time.time()
+			self.version += 1
+			self.bodies = {}
+	# A method to serve the rendered body of the latest version in a format, 'json' or 'html', along with its tag and the time at which it was published
+	def render(self, format):
+		with self.lock:
+			if format not in self.bodies:
+				if format == 'json':
+					self.bodies[format] = self.renderJSON()
+				else:
+					self.bodies[format] = self.renderHTML()
+			return self.bodies[format], '"%s-%x"' % (self.tag, self.version), self.timePublished
+	# A method to render the snapshot as JSON: the time of the acquisition, each host with its description, and the value and validity of each of its measurements, and the parameters
+	def renderJSON(self):
+		return json.dumps({
+			't': self.timestmp,
+			'hosts': [{'h': hostData, 'm': dict((name, value) for name, (value, isValid) in measurements.items()), 'v': dict((name, isValid) for name, (value, isValid) in measurements.items())} for key, hostData, measurements in self.hosts],
+			'p': self.parameters
+		}, sort_keys=True)
+	# A method to render the snapshot as a web page, as one table of entries, each identified by the key of its host and its name, or by its name for the parameters
+	def renderHTML(self):
+		entries = [('timestmp', self.timestmp)]
+		for key, hostData, measurements in self.hosts:
+			entries.extend((key + '_' + name, value) for name, (value, isValid) in sorted(measurements.items()) if isValid)
+		entries.extend(sorted(self.parameters.items()))
+		body = common.styleguide['header']['html']
+		for name, value in entries:
+			body += common.styleguide['entryLeft']['html'] + cgi.escape(name, True) + common.styleguide['entryMid']['html'] + cgi.escape(str(value)) + common.styleguide['entryRight']['html']
+		return body + common.styleguide['footer']['html']
+
+# The snapshot shared by the acquisition loop and the server
+snapshot = latestSnapshot()
+
+# A class to answer each request for the snapshot, never touching the hosts, mixed into the handler of the HTTP server, which is a classic class, once it is imported
+class handlerLatest:
+	# The formats of the snapshot, and their content types, against their paths
+	paths = {
+		'/': ('html', 'text/html; charset=utf-8'),
+		'/latest': ('html', 'text/html; charset=utf-8'),
+		'/latest.html': ('html', 'text/html; charset=utf-8'),
+		'/latest.json': ('json', 'application/json')
+	}
+	# A method to serve the snapshot, or to tell the client that the copy it holds is current
+	def do_GET(self):
+		path = self.path.split('?')[0]
+		if path == '/history.json':
+			self.sendHistory()
+			return
+		if path not in self.paths:
+			self.send_error(404)
+			return
+		format, contentType = self.paths[path]
+		body, etag, timePublished = snapshot.render(format)
+		lastModified = email.utils.formatdate(timePublished, usegmt=True)
+		if self.isCurrent(etag, timePublished):
+			self.send_response(304)
+			self.send_header('ETag', etag)
+			self.send_header('Last-Modified', lastModified)
+			self.end_headers()
+			return
+		self.send_response(200)
+		self.send_header('Content-Type', contentType)
+		self.send_header('Content-Length', str(len(body)))
+		self.send_header('ETag', etag)
+		self.send_header('Last-Modified', lastModified)
+		self.send_header('Cache-Control', 'no-cache')
+		self.end_headers()
+		self.wfile.write(body)
+	# A method to serve the history of a host over a range of times, in seconds since the epoch, optionally for some names and downsampled to steps, or else, the list of hosts with a history
+	def sendHistory(self):
+		store = self.server.history() if self.server.history is not None else None
+		if store is None:
+			self.send_error(404)
+			return
+		query = urlparse.parse_qs(urlparse.urlparse(self.path).query)
+		try:
+			if 'host' not in query:
+				result = {'hosts': store.hosts()}
+			else:
+				timeEnd = float(query.get('end', [time.time()])[0])
+				timeStart = float(query.get('start', [timeEnd - 3600.0])[0])
+				names = query['names'][0].split(',') if 'names' in query else None
+				step = float(query['step'][0]) if 'step' in query else None
+				names, rows = store.query(query['host'][0], timeStart, timeEnd, names, step)
+				result = {'host': query['host'][0], 'n': names, 'rows': rows}
+		except ValueError as error:
+			self.send_error(400, str(error))
+			return
+		body = json.dumps(result)
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+	# A method to check if the copy that the client holds is current, by its tag, or else, by its date
+	def isCurrent(self, etag, timePublished):
+		tags = self.headers.getheader('If-None-Match')
+		if tags is not None:
+			return (tags.strip() == '*') or (etag in [tag.strip() for tag in tags.split(',')])
+		since = self.headers.getheader('If-Modified-Since')
+		if since is not None:
+			parsed = email.utils.parsedate_tz(since)
+			if parsed is not None:
+				return int(timePublished) <= email.utils.mktime_tz(parsed)
+		return False
+	# A method to keep requests out of the output of the client
+	def log_message(self, format, *arguments):
+		pass
+
+# A class to serve the snapshot over HTTP from a thread of its own, which sleeps until asked
+class server(threading.Thread):
+	# The constructor for the server class, given a function that returns the historian, if any, to serve the history too
+	def __init__(self, port, address=addressDefault, history=None):
+		super(server, self).__init__()
+		self.daemon = True
+		global email, cgi, urlparse, BaseHTTPServer, SocketServer
+		if BaseHTTPServer is None:
+			common.importLibrary('email.utils')
+			email = common.importLibrary('email')
+			cgi = common.importLibrary('cgi')
+			urlparse = common.importLibrary('urlparse')
+			SocketServer = common.importLibrary('SocketServer')
+			BaseHTTPServer = common.importLibrary('BaseHTTPServer')
+		# Answer each client on a thread of its own, so that a slow one holds up no other
+		class serverHTTP(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+			daemon_threads = True
+		class handlerHTTP(handlerLatest, BaseHTTPServer.BaseHTTPRequestHandler):
+			pass
+		self.server = serverHTTP((address, port), handlerHTTP)
+		self.server.history = history
+	# A method to serve until stopped
+	def run(self):
+		self.server.serve_forever()
+	# A method to stop serving
+	def stop(self):
+		self.server.shutdown()
+		self.server.server_close()
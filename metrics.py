@@ -0,0 +1,183 @@
+# Handle files of the text file exposition
+import os
+# Handle threads of this process
+import threading
+# Handle timings
+import time
+# Time blocks of code
+import contextlib
+# Import the HTTP server only once the exposition is served over HTTP
+import common
+
+# Serve the HTTP exposition, once asked to
+BaseHTTPServer = None
+
+# Upper bounds of the buckets of every histogram of latencies, in seconds
+bucketsDefault = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Address on which the HTTP exposition listens, unless the configuration specifies one
+addressDefault = '127.0.0.1'
+
+# A dictionary of the type and description of every metric, against its name
+descriptions = {
+	'marshal_cycle_seconds': ('histogram', 'Latency of a cycle of acquisition and despatch'),
+	'marshal_acquire_seconds': ('histogram', 'Latency of the acquisition of a snapshot from every host'),
+	'marshal_measure_seconds': ('histogram', 'Latency of the retrieval of measurements from a host'),
+	'marshal_measure_errors_total': ('counter', 'Retrievals of measurements from a host that failed'),
+	'marshal_filter_seconds': ('histogram', 'Latency of the check of the measurements of a host against their thresholds'),
+	'marshal_sanity_rejections_total': ('counter', 'Retrievals of measurements from a host with at least one measurement out of its thresholds'),
+	'marshal_validity_rejections_total': ('counter', 'Measurements out of their thresholds'),
+	'marshal_parameter_seconds': ('histogram', 'Latency of the retrieval of a parameter from the Raspberry Pi'),
+	'marshal_dispatch_seconds': ('histogram', 'Latency of the despatch of a combination to its server'),
+	'marshal_dispatch_errors_total': ('counter', 'Despatches of a payload that the server could not accept'),
+	'marshal_dispatch_retries_total': ('counter', 'Attempts on a server retried after a failure'),
+	'marshal_dispatch_dropped_total': ('counter', 'Despatches dropped since too many awaited a server'),
+	'marshal_dispatch_queue_depth': ('gauge', 'Despatches that await the threads of a server'),
+	'marshal_breaker_open': ('gauge', 'Whether the circuit to a server is open, after too many failures in a row'),
+	'marshal_breaker_rejections_total': ('counter', 'Attempts on a server failed without being made, since its circuit was open'),
+	'marshal_ondemand_seconds': ('histogram', 'Latency of the follow-up despatch of measurements that a server required on-demand'),
+	'marshal_ondemand_cache_hits_total': ('counter', 'On-demand variables served from the values prefetched'),
+	'marshal_ondemand_cache_misses_total': ('counter', 'On-demand variables read afresh, since no prefetched value held'),
+	'marshal_http_errors_total': ('counter', 'Requests to an HTTP server that failed, by kind'),
+	'marshal_queue_depth': ('gauge', 'Samples or rows held for a server until its next write'),
+	'marshal_rows_dropped_total': ('counter', 'Rows dropped, oldest first, beyond the limit held for a MySQL server that cannot accept them'),
+	'marshal_journal_bytes': ('gauge', 'Bytes of payloads in the journal of a server that await replay'),
+	'marshal_modbus_timeouts_total': ('counter', 'Requests to a Modbus TCP host on the pipelined transport that failed or timed out')
+}
+
+# A function to render a set of labels, sorted by name
+def renderLabels(labels, extra=()):
+	pairs = list(labels) + list(extra)
+	if not pairs:
+		return ''
+	return '{' + ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in pairs) + '}'
+
+# A class to represent a histogram of observations in cumulative buckets
+class histogram(object):
+	# The constructor for the histogram class
+	def __init__(self, buckets=bucketsDefault):
+		super(histogram, self).__init__()
+		# Upper bounds of the buckets
+		self.buckets = buckets
+		# Number of observations in each bucket, but not in any lower one; the last counts those beyond every bound
+		self.counts = [0] * (len(buckets) + 1)
+		# The sum and the number of every observation
+		self.sum = 0.0
+		self.count = 0
+	# A method to count an observation
+	def observe(self, value):
+		bucketIndex = 0
+		while (bucketIndex < len(self.buckets)) and (value > self.buckets[bucketIndex]):
+			bucketIndex += 1
+		self.counts[bucketIndex] += 1
+		self.sum += value
+		self.count += 1
+	# A method to render the histogram in the Prometheus text format
+	def render(self, name, labels):
+		lines = []
+		cumulative = 0
+		for bound, count in zip(self.buckets, self.counts):
+			cumulative += count
+			lines.append(name + '_bucket' + renderLabels(labels, [('le', repr(bound))]) + ' ' + str(cumulative))
+		lines.append(name + '_bucket' + renderLabels(labels, [('le', '+Inf')]) + ' ' + str(self.count))
+		lines.append(name + '_sum' + renderLabels(labels) + ' ' + repr(self.sum))
+		lines.append(name + '_count' + renderLabels(labels) + ' ' + str(self.count))
+		return lines
+
+# A class to keep every counter, gauge and histogram of this process, rendered only when scraped
+class metricsRegistry(object):
+	# The constructor for the metricsRegistry class
+	def __init__(self):
+		super(metricsRegistry, self).__init__()
+		# A dictionary of the values of counters and gauges, and of histograms, against their names and labels
+		self.values = {}
+		self.histograms = {}
+		# Lock that lets only one thread at a time touch the metrics
+		self.lock = threading.Lock()
+	# A method to add to a counter
+	def increment(self, name, amount=1, **labels):
+		key = (name, tuple(sorted(labels.items())))
+		with self.lock:
+			self.values[key] = self.values.get(key, 0) + amount
+	# A method to set a gauge
+	def set(self, name, value, **labels):
+		with self.lock:
+			self.values[(name, tuple(sorted(labels.items())))] = value
+	# A method to count an observation in a histogram
+	def observe(self, name, value, **labels):
+		key = (name, tuple(sorted(labels.items())))
+		with self.lock:
+			if key not in self.histograms:
+				self.histograms[key] = histogram()
+			self.histograms[key].observe(value)
+	# A method to observe the latency of a block of code, whether or not it fails
+	@contextlib.contextmanager
+	def timer(self, name, **labels):
+		timeStart = time.time()
+		try:
+			yield
+		finally:
+			self.observe(name, time.time() - timeStart, **labels)
+	# A method to render every metric in the Prometheus text format
+	def render(self):
+		lines = []
+		with self.lock:
+			series = {}
+			for (name, labels), value in self.values.items():
+				series.setdefault(name, []).append((labels, repr(value) if isinstance(value, float) else str(value)))
+			for (name, labels), each in self.histograms.items():
+				series.setdefault(name, []).append((labels, each))
+			for name in sorted(series.keys()):
+				metricType, description = descriptions.get(name, ('untyped', ''))
+				lines.append('# HELP ' + name + ' ' + description)
+				lines.append('# TYPE ' + name + ' ' + metricType)
+				for labels, value in sorted(series[name]):
+					if isinstance(value, histogram):
+						lines.extend(value.render(name, labels))
+					else:
+						lines.append(name + renderLabels(labels) + ' ' + value)
+		return '\n'.join(lines) + '\n'
+	# A method to write every metric to a file, atomically, for the text file collector of a node exporter
+	def write(self, filename):
+		with open(filename + '.tmp', 'wb') as filehandle:
+			filehandle.write(self.render())
+		os.rename(filename + '.tmp', filename)
+
+# The metrics shared by every module of this process
+registry = metricsRegistry()
+
+# A class to answer each scrape of the HTTP exposition, mixed into the handler of the HTTP server, which is a classic class, once it is imported
+class handlerMetrics:
+	# A method to render the metrics, only when asked for them
+	def do_GET(self):
+		if self.path.split('?')[0] not in ('/', '/metrics'):
+			self.send_error(404)
+			return
+		body = registry.render()
+		self.send_response(200)
+		self.send_header('Content-Type', 'text/plain; version=0.0.4')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+	# A method to keep scrapes out of the output of the client
+	def log_message(self, format, *arguments):
+		pass
+
+# A class to serve the metrics over HTTP from a thread of its own, which sleeps until scraped
+class exporter(threading.Thread):
+	# The constructor for the exporter class
+	def __init__(self, port, address=addressDefault):
+		super(exporter, self).__init__()
+		self.daemon = True
+		global BaseHTTPServer
+		if BaseHTTPServer is None:
+			BaseHTTPServer = common.importLibrary('BaseHTTPServer')
+		class handlerHTTP(handlerMetrics, BaseHTTPServer.BaseHTTPRequestHandler):
+			pass
+		self.server = BaseHTTPServer.HTTPServer((address, port), handlerHTTP)
+	# A method to serve until stopped
+	def run(self):
+		self.server.serve_forever()
+	# A method to stop serving
+	def stop(self):
+		self.server.shutdown()
+		self.server.server_close()
@@ -0,0 +1,146 @@
+# Aid data exchange
+import json
+# Find the profiles on disk
+import os
+# Decode blocks of registers in one pass
+import struct
+# Represent profiles and their points as immutable records
+import collections
+
+# Directory of the profiles of the hosts supported by this version of the software
+directoryDefault = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'devices')
+# Largest number of unused registers that may be read to merge two neighbouring reads into one, unless the profile or the host specifies one
+maximumGapDefault = 8
+# Largest number of registers that may be read in one transaction, unless the profile or the host specifies one
+maximumLengthDefault = 125
+
+# The struct codes of the values that a point may hold, against its type, its signedness and its word count
+codes = {
+	('integer', False, 1): 'H',
+	('integer', True, 1): 'h',
+	('integer', False, 2): 'I',
+	('integer', True, 2): 'i',
+	('integer', False, 4): 'Q',
+	('integer', True, 4): 'q',
+	('float', True, 2): 'f',
+	('float', True, 4): 'd'
+}
+
+# One point of a register map: the name of its measurement, the address and number of its registers, the type of its value, its signedness, the order of the bytes in each register and of the registers in the value, the division factor into its unit, and the base of each register over the next for a cascade of registers
+registerPoint = collections.namedtuple('registerPoint', ['label', 'address', 'count', 'type', 'isSigned', 'byteOrder', 'wordOrder', 'factor', 'base'])
+# A profile of a host: its manufacturer and model, the name of the class in equipment that talks to it, whether its measurements may equal their thresholds, its block read limits, and its points in the order of their measurement indices, from 1
+deviceProfile = collections.namedtuple('deviceProfile', ['manufacturer', 'modelNumber', 'driver', 'isInclusive', 'maximumGap', 'maximumLength', 'points'])
+
+# A function to compile the settings of a point in a profile, in which every value is a string, as elsewhere in the configuration
+def compilePoint(settings, byteOrder, wordOrder):
+	point = registerPoint(
+		settings['label'],
+		int(settings['address']),
+		int(settings.get('count', '1')),
+		settings.get('type', 'integer'),
+		settings.get('signed', 'False') == 'True',
+		settings.get('byteOrder', byteOrder),
+		settings.get('wordOrder', wordOrder),
+		float(settings.get('factor', '1')),
+		int(settings.get('base', '65536'))
+	)
+	if (point.byteOrder not in ('big', 'little')) or (point.wordOrder not in ('big', 'little')):
+		raise ValueError(point.label + ' has an unknown byte or word order')
+	# A cascade is any number of unsigned registers, each worth a base of the next less significant one
+	if point.type == 'cascade':
+		if point.count < 1:
+			raise ValueError(point.label + ' has no registers')
+	elif (point.type, point.isSigned or (point.type == 'float'), point.count) not in codes:
+		raise ValueError(point.label + ' has an unsupported type or word count')
+	return point
+
+# A function to load a profile from a JSON-formatted file
+def loadProfile(filename):
+	with open(filename) as filehandle:
+		settings = json.load(filehandle)
+	byteOrder = settings.get('byteOrder', 'big')
+	wordOrder = settings.get('wordOrder', 'big')
+	return deviceProfile(
+		settings['manufacturer'],
+		settings['modelNumber'],
+		settings['driver'],
+		settings.get('isInclusive', 'True') == 'True',
+		int(settings.get('maximumGap', str(maximumGapDefault))),
+		int(settings.get('maximumLength', str(maximumLengthDefault))),
+		tuple(compilePoint(each, byteOrder, wordOrder) for each in settings.get('points', []))
+	)
+
+# A class to decode the blocks of registers read from a host into the scaled values of its measurements, with one struct pass per block
+class registerDecoder(object):
+	# The constructor for the registerDecoder class, which compiles the points of a profile against the blocks that cover them
+	def __init__(self, points, blocks):
+		super(registerDecoder, self).__init__()
+		# Each block compiles into the order in which to take its registers, the positions of those whose bytes are swapped, the formats to pack them and to unpack the values, and the values as plain and as cascaded measurements
+		self.blocks = []
+		for registerAddress, registerCount, members in blocks:
+			order = []
+			swapped = []
+			unpackFormat = '>'
+			plain = []
+			cascaded = []
+			for index, offset in members:
+				point = points[index - 1]
+				# Registers are taken most significant first, so that a big-endian format fits every value
+				offsets = range(offset, offset + point.count)
+				if point.wordOrder == 'little':
+					offsets.reverse()
+				if point.byteOrder == 'little':
+					swapped.extend(range(len(order), len(order) + point.count))
+				position = len(unpackFormat) - 1
+				order.extend(offsets)
+				if point.type == 'cascade':
+					unpackFormat += 'H' * point.count
+					cascaded.append((index - 1, position, point.count, point.base, point.factor))
+				else:
+					unpackFormat += codes[(point.type, point.isSigned or (point.type == 'float'), point.count)]
+					plain.append((index - 1, position, point.factor))
+			self.blocks.append((order, swapped, '>%dH' % len(order), unpackFormat, plain, cascaded))
+	# A method to decode a list of blocks of registers, in the order of the blocks, into the values of the measurements that they cover
+	def decode(self, registerBlocks, payload):
+		for (order, swapped, packFormat, unpackFormat, plain, cascaded), registerBlock in zip(self.blocks, registerBlocks):
+			words = [registerBlock[offset] for offset in order]
+			for position in swapped:
+				words[position] = ((words[position] & 0xFF) << 8) | (words[position] >> 8)
+			values = struct.unpack(unpackFormat, struct.pack(packFormat, *words))
+			for index, position, factor in plain:
+				payload[index] = values[position] / factor
+			for index, position, count, base, factor in cascaded:
+				value = 0
+				for word in values[position:position + count]:
+					value = value * base + word
+				payload[index] = value / factor
+
+# A class to keep the profile of every host supported by this version of the software, against its manufacturer and model
+class profileRegistry(object):
+	# The constructor for the profileRegistry class
+	def __init__(self):
+		super(profileRegistry, self).__init__()
+		# A dictionary of profiles against the manufacturers and models of their hosts
+		self.profiles = {}
+		# Flag to indicate that the profiles shipped with the software have been loaded
+		self.isLoaded = -1
+	# A method to load every profile in a directory, replacing any of the same host
+	def load(self, directory=directoryDefault):
+		for filename in sorted(os.listdir(directory)):
+			if not filename.endswith('.json'):
+				continue
+			try:
+				profile = loadProfile(os.path.join(directory, filename))
+			except (IOError, ValueError, KeyError) as error:
+				print 'Load Profile Fail - ' + filename + ' - ' + str(error)
+				continue
+			self.profiles[(profile.manufacturer, profile.modelNumber)] = profile
+		self.isLoaded = 0
+	# A method to find the profile of a host, or None if it is not supported
+	def lookup(self, manufacturer, modelNumber):
+		if self.isLoaded == -1:
+			self.load()
+		return self.profiles.get((manufacturer, modelNumber))
+
+# The profiles shared by every module of this process
+registry = profileRegistry()
@@ -0,0 +1,56 @@
+# Store samples as compact, typed arrays
+import array
+# Serialize access to a ring from the thread that fills it and those that read it
+import threading
+
+# Number of samples that a ring keeps, unless the host specifies one
+depthDefault = 60
+
+# A class to represent one sample of the measurements of a host: a timestamp, and a value and a validity flag per measurement
+class sampleRecord(object):
+	# Slots keep each record to its three fields
+	__slots__ = ('timestmp', 'values', 'validity')
+	# The constructor for the sampleRecord class
+	def __init__(self, width):
+		super(sampleRecord, self).__init__()
+		# The time at which the sample was taken, in seconds since the epoch
+		self.timestmp = 0.0
+		# The value of each measurement
+		self.values = array.array('d', [0.0] * width)
+		# The flag indicating the validity of each measurement
+		self.validity = array.array('b', [0] * width)
+
+# A class to keep the latest samples of a host in a bounded ring of preallocated records
+class sampleRing(object):
+	# The constructor for the sampleRing class
+	def __init__(self, width, depth=depthDefault):
+		super(sampleRing, self).__init__()
+		# The records, allocated once and overwritten oldest first
+		self.records = [sampleRecord(width) for recordIndex in range(0, depth)]
+		# The index of the latest record
+		self.head = -1
+		# The number of records that hold samples
+		self.count = 0
+		# Lock that keeps readers off a record while it is overwritten
+		self.lock = threading.Lock()
+	# A method to copy a sample into the ring, in place of the oldest one
+	def append(self, timestmp, values, validity):
+		with self.lock:
+			self.head = (self.head + 1) % len(self.records)
+			record = self.records[self.head]
+			record.timestmp = timestmp
+			record.values[:] = values
+			record.validity[:] = validity
+			self.count = min(self.count + 1, len(self.records))
+	# A method to copy out up to a number of the latest samples, newest first, as tuples of a timestamp, a list of values and a list of validity flags
+	def history(self, count=None):
+		with self.lock:
+			if (count is None) or (count > self.count):
+				count = self.count
+			return [(record.timestmp, record.values.tolist(), record.validity.tolist()) for record in (self.records[(self.head - recordIndex) % len(self.records)] for recordIndex in range(0, count))]
+	# A method to copy out the latest sample, or None if there is none
+	def latest(self):
+		samples = self.history(1)
+		if samples:
+			return samples[0]
+		return None
@@ -0,0 +1,350 @@
+# Import the libraries of each kind of server only once a server needs them
+import common
+# Handle sleeps and delays
+import time
+# Rebase the groups of samples that are trimmed
+import datetime
+# Serialize the threads that despatch to one server
+import threading
+# Aid data exchange
+import json
+# Compress batches of samples
+import zlib
+# Count the requests that fail
+import metrics
+# Size the pool of connections to the threads of each server
+import workers
+
+# Despatch HTTP requests as a client, and pool connections of HTTP sessions, once a server over HTTP needs to
+requests = None
+# Handle communications with a MySQL database, once a server needs to
+MySQLdb = None
+# Encode batches of samples compactly, where available, once a server needs to
+msgpack = None
+
+# Interval to wait for a connection to a server, in seconds, unless the server specifies one
+timeoutConnectDefault = 5.0
+# Interval to wait for a response from a server, in seconds, unless the server specifies one
+timeoutReadDefault = 30.0
+# Number of rows to collect before writing them to a database, unless the server specifies one
+batchSizeDefault = 100
+# Interval to hold rows before writing them to a database, in seconds, unless the server specifies one
+batchIntervalDefault = 60.0
+# Number of samples to hold for a server that cannot accept them, beyond which the oldest are dropped, unless the server specifies one
+batchLimitDefault = 10000
+
+# A class to represent an HTTP server that accepts energy data, over one persistent session
+class sinkHTTP(object):
+	# The constructor for the sinkHTTP class
+	def __init__(self, server):
+		super(sinkHTTP, self).__init__()
+		global requests
+		if requests is None:
+			requests = common.importLibrary('requests')
+			common.importLibrary('requests.adapters')
+		# The URLs of the server, for single payloads and for batches of them, resolved once, bewaring of port numbers
+		if not server['portnumber']:
+			self.url = server['protocol'] + "://" + server['hostname'] + server['path']
+			self.urlBulk = server['protocol'] + "://" + server['hostname'] + server.get('pathBulk', server['path'])
+		else:
+			self.url = server['protocol'] + "://" + server['hostname'] + ":" + server['portnumber'] + server['path']
+			self.urlBulk = server['protocol'] + "://" + server['hostname'] + ":" + server['portnumber'] + server.get('pathBulk', server['path'])
+		# Connect and read timeouts
+		self.timeout = (float(server.get('timeoutConnect', timeoutConnectDefault)), float(server.get('timeoutRead', timeoutReadDefault)))
+		# The session keeps its connections alive across requests
+		self.session = requests.Session()
+		self.session.mount(server['protocol'] + "://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(4, int(server.get('concurrency', workers.concurrencyDefault)) + 1)))
+		self.session.auth = (server['username'], server['password'])
+		# Beware of self-signed certificates
+		if server['certificate']:
+			self.session.verify = server['certificate']
+	# A method to post a request to the server and return its response, or None if the server could not accept it
+	def send(self, url, **arguments):
+		try:
+			response = self.session.post(url, timeout=self.timeout, **arguments)
+			response.raise_for_status()
+		except requests.RequestException as error:
+			print 'Despatch Fail - ' + url + ' - ' + str(error)
+			metrics.registry.increment('marshal_http_errors_total', url=url, kind='timeout' if isinstance(error, requests.Timeout) else 'error')
+			return None
+		return response
+	# A method to post a payload to the server
+	def post(self, requestPayload):
+		return self.send(self.url, json=requestPayload)
+	# A method to post a list of payloads to the server in one request
+	def postBulk(self, requestPayloads):
+		return self.send(self.urlBulk, json=requestPayloads)
+	# A method to check if whatever awaits a write is due, of which there is nothing over HTTP
+	def isDue(self):
+		return False
+	# A method to write whatever awaits a write, of which there is nothing over HTTP, so that the server is never contacted
+	def flush(self, force=False):
+		return False
+	# A method to count whatever awaits a write
+	def depth(self):
+		return 0
+	# A method to close every connection of the session
+	def close(self):
+		self.session.close()
+
+# A class to represent an HTTP server that accepts batches of samples, each batch sending the description of a host and the names of its variables once, and compressed
+class sinkHTTPBatch(sinkHTTP):
+	# The constructor for the sinkHTTPBatch class
+	def __init__(self, server):
+		super(sinkHTTPBatch, self).__init__(server)
+		# The encoding of a batch, before compression: 'json', or 'msgpack' where available
+		self.encoding = server.get('encoding', 'json')
+		global msgpack
+		if (self.encoding == 'msgpack') and (msgpack is None):
+			try:
+				msgpack = common.importLibrary('msgpack')
+			except ImportError:
+				pass
+		if (self.encoding == 'msgpack') and (msgpack is None):
+			print 'Batch Encoding Warning - msgpack unavailable, using json'
+			self.encoding = 'json'
+		if self.encoding == 'msgpack':
+			self.headers = {'Content-Type': 'application/msgpack', 'Content-Encoding': 'gzip'}
+		else:
+			self.headers = {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'}
+		# Number of samples, and interval in seconds, that trigger a request, and the number of samples to hold at most
+		self.batchSize = int(server.get('batchSize', batchSizeDefault))
+		self.batchInterval = float(server.get('batchInterval', batchIntervalDefault))
+		self.batchLimit = int(server.get('batchLimit', batchLimitDefault))
+		# A list of groups of samples that await a request, each sharing a host and a list of variable names, and a dictionary of their indices against those
+		self.groups = []
+		self.groupIndices = {}
+		# The time of the first sample of each group, and the time of each of its samples, as text
+		self.origins = []
+		self.timeTexts = []
+		# Flags to indicate that the payloads of the host of each group are to be stored
+		self.toStore = []
+		# The journal of the server, into which the groups of hosts whose payloads are to be stored move once the server cannot accept them, if any
+		self.journal = None
+		# Number of samples that await a request
+		self.sampleCount = 0
+		# The time at which the oldest sample that awaits a request was collected
+		self.timeOldest = 0.0
+		# Lock that lets only one thread at a time touch the batch
+		self.lock = threading.Lock()
+	# A method to add a sample of a host to the batch, which is posted once flushed
+	def add(self, hostData, variableNames, timeText, timestmp, values, validity, sanity, toStore=False):
+		key = (tuple(sorted(hostData.items())), variableNames)
+		with self.lock:
+			# The first sample of a host and a list of variable names opens a group, with the description, the names and the time of the sample ...
+			if key not in self.groupIndices:
+				self.groupIndices[key] = len(self.groups)
+				self.groups.append({'h': hostData, 'n': list(variableNames), 't0': timeText, 'dt': [], 'm': [], 'q': [], 's': []})
+				self.origins.append(timestmp)
+				self.timeTexts.append([])
+				self.toStore.append(toStore)
+			# ... and every sample adds its time, in milliseconds since the first, its values, as numbers, their validity, and the validity of the host's measurement
+			groupIndex = self.groupIndices[key]
+			group = self.groups[groupIndex]
+			group['dt'].append(int(round((timestmp - self.origins[groupIndex]).total_seconds() * 1000)))
+			group['m'].append(list(values))
+			group['q'].append(list(validity))
+			group['s'].append(sanity)
+			self.timeTexts[groupIndex].append(timeText)
+			if self.sampleCount == 0:
+				self.timeOldest = time.time()
+			self.sampleCount += 1
+			# Hold no more than the limit, however long the server cannot accept them
+			self.trim()
+	# A method to drop the oldest samples beyond the limit: whole groups while the excess covers them, and then the oldest samples of the oldest group, which starts afresh at the first one that remains
+	def trim(self):
+		# The samples of hosts whose payloads are to be stored are never dropped, but journaled
+		if (self.sampleCount > self.batchLimit) and (self.journal is not None):
+			self.store()
+		while self.sampleCount > self.batchLimit:
+			group = self.groups[0]
+			excess = self.sampleCount - self.batchLimit
+			if excess >= len(group['dt']):
+				self.sampleCount -= len(group['dt'])
+				self.groups.pop(0)
+				self.origins.pop(0)
+				self.timeTexts.pop(0)
+				self.toStore.pop(0)
+				self.groupIndices = dict((key, groupIndex - 1) for key, groupIndex in self.groupIndices.items() if groupIndex > 0)
+				continue
+			shift = group['dt'][excess]
+			for field in ('dt', 'm', 'q', 's'):
+				del group[field][:excess]
+			group['dt'] = [dt - shift for dt in group['dt']]
+			del self.timeTexts[0][:excess]
+			group['t0'] = self.timeTexts[0][0]
+			self.origins[0] += datetime.timedelta(milliseconds=shift)
+			self.sampleCount -= excess
+	# A method to move the groups of hosts whose payloads are to be stored into the journal, each as a record that survives a loss of power, to be replayed once the server can accept them
+	def store(self):
+		moved = set()
+		try:
+			for groupIndex, group in enumerate(self.groups):
+				if self.toStore[groupIndex]:
+					self.journal.append(group)
+					moved.add(groupIndex)
+		finally:
+			if moved:
+				keys = dict((groupIndex, key) for key, groupIndex in self.groupIndices.items())
+				remaining = [groupIndex for groupIndex in range(0, len(self.groups)) if groupIndex not in moved]
+				self.sampleCount -= sum(len(self.groups[groupIndex]['dt']) for groupIndex in moved)
+				self.groups = [self.groups[groupIndex] for groupIndex in remaining]
+				self.origins = [self.origins[groupIndex] for groupIndex in remaining]
+				self.timeTexts = [self.timeTexts[groupIndex] for groupIndex in remaining]
+				self.toStore = [self.toStore[groupIndex] for groupIndex in remaining]
+				self.groupIndices = dict((keys[groupIndex], position) for position, groupIndex in enumerate(remaining))
+	# A method to count the samples that await a request
+	def depth(self):
+		return self.sampleCount
+	# A method to encode and compress the batch, or else, a list of groups
+	def encode(self, groups=None):
+		batch = {'g': self.groups if groups is None else groups}
+		if self.encoding == 'msgpack':
+			body = msgpack.packb(batch)
+		else:
+			body = json.dumps(batch, separators=(',', ':'))
+		# A window of 31 bits makes a gzip stream
+		compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+		return compressor.compress(body) + compressor.flush()
+	# A method to check if the batch is due: if there are enough samples or they are old enough
+	def isDue(self):
+		return (self.sampleCount > 0) and ((self.sampleCount >= self.batchSize) or (time.time() - self.timeOldest >= self.batchInterval))
+	# A method to post the batch, once due, or regardless when forced, and return True if the server accepted it, None if it could not, or False if there was nothing to post, without contacting the server
+	def flush(self, force=False):
+		with self.lock:
+			if (self.sampleCount == 0) or not (force or self.isDue()):
+				return False
+			# Journal the samples of hosts whose payloads are to be stored, and hold the others for the next attempt, as trimmed to the limit when added, if the server cannot accept them ...
+			if self.send(self.url, data=self.encode(), headers=self.headers) is None:
+				if self.journal is not None:
+					self.store()
+				return None
+			# ... or else, forget them
+			self.groups = []
+			self.groupIndices = {}
+			self.origins = []
+			self.timeTexts = []
+			self.toStore = []
+			self.sampleCount = 0
+			return True
+	# A method to post a list of groups of samples, as replayed from the journal, in one batch
+	def postBulk(self, groups):
+		return self.send(self.url, data=self.encode(groups), headers=self.headers)
+	# A method to post the remaining samples and close every connection of the session
+	def close(self):
+		try:
+			self.flush(True)
+		finally:
+			self.session.close()
+
+# A class to represent a MySQL server that accepts energy data, over one persistent connection, in batches
+class sinkMySQL(object):
+	# The constructor for the sinkMySQL class
+	def __init__(self, server):
+		super(sinkMySQL, self).__init__()
+		global MySQLdb
+		if MySQLdb is None:
+			MySQLdb = common.importLibrary('MySQLdb')
+		# Space for storing the settings of the connection
+		self.server = server
+		# Space for storing the connection's handle, opened when first needed
+		self.handle = None
+		# Number of rows, and interval in seconds, that trigger a write, and the number of rows to hold at most
+		self.batchSize = int(server.get('batchSize', batchSizeDefault))
+		self.batchInterval = float(server.get('batchInterval', batchIntervalDefault))
+		self.batchLimit = int(server.get('batchLimit', batchLimitDefault))
+		# A dictionary of parameterized statements against their tables and columns
+		self.statements = {}
+		# A list of rows that await a write, oldest first, each with its statement
+		self.rows = []
+		# Number of rows that await a write
+		self.rowCount = 0
+		# The time at which the oldest row that awaits a write was collected
+		self.timeOldest = 0.0
+		# Connect, read and write timeouts, in whole seconds
+		self.timeouts = {'connect_timeout': int(float(server.get('timeoutConnect', timeoutConnectDefault))), 'read_timeout': int(float(server.get('timeoutRead', timeoutReadDefault))), 'write_timeout': int(float(server.get('timeoutRead', timeoutReadDefault)))}
+		# Lock that lets only one thread at a time touch the rows
+		self.lock = threading.Lock()
+	# A method to open the connection
+	def connect(self):
+		if self.server['portnumber']:
+			self.handle = MySQLdb.connect(self.server['hostname'], self.server['username'], self.server['password'], self.server['databasename'], port=int(self.server['portnumber']), **self.timeouts)
+		else:
+			self.handle = MySQLdb.connect(self.server['hostname'], self.server['username'], self.server['password'], self.server['databasename'], **self.timeouts)
+	# A method to collect a row for a table, which is written once flushed
+	def insert(self, table, timestmp, measurementData):
+		columns = tuple(sorted(measurementData.keys()))
+		with self.lock:
+			# Compose the statement for a table and its columns just once
+			try:
+				statement = self.statements[(table, columns)]
+			except KeyError:
+				statement = "INSERT INTO `" + table + "` (`isSynced`, `timestmp`" + "".join(", `" + column + "`" for column in columns) + ") VALUES (False, %s" + ", %s" * len(columns) + ")"
+				self.statements[(table, columns)] = statement
+			if self.rowCount == 0:
+				self.timeOldest = time.time()
+			self.rows.append((statement, (timestmp,) + tuple(measurementData[column] for column in columns)))
+			self.rowCount += 1
+			# Hold no more than the limit, however long the server cannot accept them, dropping the oldest
+			if self.rowCount > self.batchLimit:
+				excess = self.rowCount - self.batchLimit
+				del self.rows[:excess]
+				self.rowCount -= excess
+				metrics.registry.increment('marshal_rows_dropped_total', excess, host=self.server['hostname'])
+	# A method to check if the collected rows are due: if there are enough or they are old enough
+	def isDue(self):
+		return (self.rowCount > 0) and ((self.rowCount >= self.batchSize) or (time.time() - self.timeOldest >= self.batchInterval))
+	# A method to write every collected row, once due, or regardless when forced, and return True if the server accepted them, None if it could not, or False if there was nothing to write, without contacting the server
+	def flush(self, force=False):
+		with self.lock:
+			if (self.rowCount == 0) or not (force or self.isDue()):
+				return False
+			# Reconnect once if the connection has been lost, and hold the rows for the next attempt if the server still cannot accept them ...
+			try:
+				try:
+					self.write()
+				except MySQLdb.OperationalError:
+					self.disconnect()
+					self.write()
+			except MySQLdb.Error as error:
+				print 'Despatch Fail - ' + self.server['hostname'] + ' - ' + str(error)
+				self.disconnect()
+				return None
+			# ... and forget the rows only once they are committed
+			self.rows = []
+			self.rowCount = 0
+			return True
+	# A method to count the rows that await a write
+	def depth(self):
+		return self.rowCount
+	# A method to write every collected row in a single transaction
+	def write(self):
+		if self.handle is None:
+			self.connect()
+		cursor = self.handle.cursor()
+		# Each statement is executed once, for all its rows in order
+		statements = []
+		rows = {}
+		for statement, row in self.rows:
+			if statement not in rows:
+				statements.append(statement)
+				rows[statement] = []
+			rows[statement].append(row)
+		for statement in statements:
+			cursor.executemany(statement, rows[statement])
+		self.handle.commit()
+		cursor.close()
+	# A method to close the connection
+	def disconnect(self):
+		if self.handle is not None:
+			try:
+				self.handle.close()
+			except MySQLdb.Error:
+				pass
+			self.handle = None
+	# A method to write the remaining rows and close the connection
+	def close(self):
+		try:
+			self.flush(True)
+		finally:
+			self.disconnect()
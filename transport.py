@@ -0,0 +1,241 @@
+# Handle connections to hosts over TCP
+import socket
+# Wait on many connections at once
+import select
+# Handle errors of non-blocking connections
+import errno
+# Pack and unpack Modbus frames
+import struct
+# Handle sleeps, delays and timeouts
+import time
+# Let only one thread at a time run the event loop
+import threading
+# Count the requests that fail
+import metrics
+
+# Port of a Modbus TCP host, unless the host specifies one
+portDefault = 502
+# Unit identifier of a Modbus TCP host, unless the host specifies one
+unitIdDefault = 1
+# Interval to wait for a response to a request, in seconds, unless the host specifies one
+timeoutDefault = 2.0
+# Number of requests that may await a response on one connection at once, unless the host specifies one
+pipelineDefault = 4
+# Intervals to wait before reconnecting to a host that failed, in seconds, doubling from the first up to the last
+backoffMinimum = 1.0
+backoffMaximum = 60.0
+
+# A class to represent one persistent Modbus TCP connection, over which many requests await their responses at once
+class modbusConnection(object):
+	# The constructor for the modbusConnection class
+	def __init__(self, host, port=portDefault, unitId=unitIdDefault, timeout=timeoutDefault, pipeline=pipelineDefault):
+		super(modbusConnection, self).__init__()
+		# Space for storing the address of the host
+		self.host = host
+		self.port = port
+		# Space for storing the unit identifier of the host
+		self.unitId = unitId
+		# Interval to wait for a response to each request
+		self.timeout = timeout
+		# Number of requests that may await a response at once
+		self.pipeline = pipeline
+		# Space for storing the socket, a flag to indicate that it is still connecting, and the time by which it must have connected
+		self.socket = None
+		self.isConnecting = False
+		self.timeConnect = 0.0
+		# The time before which no attempt to reconnect is made, and the interval by which it is pushed back on every failure
+		self.timeReconnect = 0.0
+		self.backoff = backoffMinimum
+		# The identifier of the latest transaction
+		self.transactionId = 0
+		# A list of requests yet to be sent, each as a transaction identifier, a frame and a callback
+		self.queue = []
+		# Bytes yet to be written to, and bytes read from, the socket
+		self.outbox = ''
+		self.inbox = ''
+		# A dictionary of requests that await a response, each as a deadline and a callback, against their transaction identifiers
+		self.pending = {}
+		# The number of hosts that share the connection
+		self.hostCount = 0
+	# A method to queue a request to read holding registers; the callback receives the list of registers, or None on failure
+	def readHoldingRegisters(self, registerAddress, registerCount, callback):
+		self.transactionId = (self.transactionId + 1) % 65536
+		frame = struct.pack('>HHHBBHH', self.transactionId, 0, 6, self.unitId, 3, registerAddress, registerCount)
+		self.queue.append((self.transactionId, frame, callback))
+	# A method to check if there is anything to do on the connection
+	def isBusy(self):
+		return bool(self.queue or self.pending)
+	# A method to open the socket, unless waiting out a failure
+	def connect(self, timeNow):
+		if timeNow < self.timeReconnect:
+			return
+		self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.socket.setblocking(0)
+		self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		result = self.socket.connect_ex((self.host, self.port))
+		if result not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+			self.fail(timeNow)
+			return
+		self.isConnecting = True
+		self.timeConnect = timeNow + self.timeout
+	# A method to close the socket after a failure to connect or to communicate, and fail every request on it, pushing back the next attempt to connect
+	def fail(self, timeNow):
+		if self.socket is not None:
+			self.socket.close()
+		self.socket = None
+		self.isConnecting = False
+		self.outbox = ''
+		self.inbox = ''
+		self.timeReconnect = timeNow + self.backoff
+		self.backoff = min(self.backoff * 2.0, backoffMaximum)
+		self.abandon()
+	# A method to fail every request that is queued or awaits a response, leaving the next attempt to connect as it is, as while waiting out a failure
+	def abandon(self):
+		callbacks = [callback for deadline, callback in self.pending.values()] + [callback for transactionId, frame, callback in self.queue]
+		self.pending = {}
+		self.queue = []
+		if callbacks:
+			metrics.registry.increment('marshal_modbus_timeouts_total', len(callbacks), host=self.host)
+		for callback in callbacks:
+			callback(None)
+	# A method to move queued requests into the pipeline, as far as it allows
+	def fill(self, timeNow):
+		while self.queue and (len(self.pending) < self.pipeline):
+			transactionId, frame, callback = self.queue.pop(0)
+			self.pending[transactionId] = (timeNow + self.timeout, callback)
+			self.outbox += frame
+	# A method to check if the connection needs to write
+	def wantsWrite(self):
+		return self.isConnecting or bool(self.outbox)
+	# A method to finish connecting, and write whatever awaits a write
+	def onWritable(self, timeNow):
+		if self.isConnecting:
+			if self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) != 0:
+				self.fail(timeNow)
+				return
+			self.isConnecting = False
+			self.backoff = backoffMinimum
+			self.fill(timeNow)
+		try:
+			written = self.socket.send(self.outbox)
+		except socket.error:
+			self.fail(timeNow)
+			return
+		self.outbox = self.outbox[written:]
+	# A method to read whatever has arrived, and hand each complete response to its callback
+	def onReadable(self, timeNow):
+		try:
+			data = self.socket.recv(4096)
+		except socket.error:
+			self.fail(timeNow)
+			return
+		if not data:
+			self.fail(timeNow)
+			return
+		self.inbox += data
+		# Each response is a header of 7 bytes whose length field counts the unit identifier and what follows it
+		while len(self.inbox) >= 7:
+			transactionId, protocolId, length = struct.unpack('>HHH', self.inbox[:6])
+			if len(self.inbox) < 6 + length:
+				break
+			frame = self.inbox[7:6 + length]
+			self.inbox = self.inbox[6 + length:]
+			if transactionId not in self.pending:
+				continue
+			deadline, callback = self.pending.pop(transactionId)
+			# Anything but a well-formed response to function 3, such as an exception, fails the request
+			if (len(frame) >= 2) and (ord(frame[0]) == 3) and (len(frame) == 2 + ord(frame[1])):
+				callback(list(struct.unpack('>%dH' % (ord(frame[1]) // 2), frame[2:])))
+			else:
+				callback(None)
+		self.fill(timeNow)
+	# A method to fail the requests whose deadlines have passed, resetting the connection since the stream can no longer be trusted
+	def expire(self, timeNow):
+		if (self.isConnecting and (self.timeConnect <= timeNow)) or any(deadline <= timeNow for deadline, callback in self.pending.values()):
+			self.fail(timeNow)
+	# A method to report the earliest deadline of the requests that await a response
+	def deadline(self):
+		if self.isConnecting:
+			return self.timeConnect
+		if self.pending:
+			return min(deadline for deadline, callback in self.pending.values())
+		return None
+
+# A class to run every Modbus TCP connection of this process on one event loop
+class modbusReactor(object):
+	# The constructor for the modbusReactor class
+	def __init__(self):
+		super(modbusReactor, self).__init__()
+		# A dictionary of connections against the addresses and unit identifiers of their hosts
+		self.connections = {}
+		# Lock that lets only one thread at a time run the loop
+		self.lock = threading.Lock()
+	# A method to share one persistent connection to a host with one more device
+	def connection(self, host, port=portDefault, unitId=unitIdDefault, timeout=timeoutDefault, pipeline=pipelineDefault):
+		key = (host, port, unitId)
+		with self.lock:
+			# Open the connection unless another device already has ...
+			if key not in self.connections:
+				self.connections[key] = modbusConnection(host, port, unitId, timeout, pipeline)
+			# ... in which case, its settings hold for every device
+			elif (self.connections[key].timeout != timeout) or (self.connections[key].pipeline != pipeline):
+				print 'Attach Connection Warning - Settings mismatch on ' + host
+			self.connections[key].hostCount += 1
+			return self.connections[key]
+	# A method to release the connection to a host, closing it when the last device leaves
+	def release(self, host, port=portDefault, unitId=unitIdDefault):
+		key = (host, port, unitId)
+		with self.lock:
+			connection = self.connections.get(key)
+			if connection is None:
+				return
+			connection.hostCount -= 1
+			if connection.hostCount > 0:
+				return
+			del self.connections[key]
+			if connection.socket is not None:
+				connection.socket.close()
+	# A method to run the loop until every queued request has been answered or has failed
+	def run(self):
+		with self.lock:
+			while True:
+				timeNow = time.time()
+				busy = [connection for connection in self.connections.values() if connection.isBusy()]
+				if not busy:
+					return
+				# Connect where needed, and fail the requests of hosts that are being waited out, without pushing back their next attempt
+				for connection in busy:
+					if connection.socket is None:
+						connection.connect(timeNow)
+						if connection.socket is None:
+							connection.abandon()
+					elif not connection.isConnecting:
+						connection.fill(timeNow)
+					connection.expire(timeNow)
+				active = [connection for connection in busy if connection.socket is not None]
+				if not active:
+					continue
+				# Wait for the sockets, but no later than the earliest deadline
+				deadlines = [connection.deadline() for connection in active if connection.deadline() is not None]
+				waiting = max(0.0, min(deadlines) - timeNow) if deadlines else timeoutDefault
+				readers = dict((connection.socket.fileno(), connection) for connection in active if not connection.isConnecting)
+				writers = dict((connection.socket.fileno(), connection) for connection in active if connection.wantsWrite())
+				try:
+					readable, writable, broken = select.select(readers.keys(), writers.keys(), [], waiting)
+				except select.error as error:
+					if error.args[0] == errno.EINTR:
+						continue
+					raise
+				timeNow = time.time()
+				for fileno in writable:
+					if writers[fileno].socket is not None:
+						writers[fileno].onWritable(timeNow)
+				for fileno in readable:
+					if readers[fileno].socket is not None:
+						readers[fileno].onReadable(timeNow)
+				for connection in active:
+					if connection.socket is not None:
+						connection.expire(timeNow)
+
+# The event loop shared by every host of this process
+reactor = modbusReactor()
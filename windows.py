@@ -0,0 +1,71 @@
+# Keep the statistics of each variable as compact, typed arrays
+import array
+# Align windows to whole multiples of their width
+import math
+# Represent the summaries of windows as immutable records
+import collections
+
+# The summary of a window: the time at which it started, in seconds since the epoch, its width, and the minimum, maximum, mean, last value and count of the valuable samples of each variable
+windowSummary = collections.namedtuple('windowSummary', ['timeStart', 'width', 'minimums', 'maximums', 'means', 'lasts', 'counts'])
+
+# A class to keep incremental statistics of a list of variables over tumbling windows of a fixed width, aligned to the epoch, in constant memory per variable
+class tumblingWindow(object):
+	# The constructor for the tumblingWindow class
+	def __init__(self, width, variableCount):
+		super(tumblingWindow, self).__init__()
+		# The width of every window, in seconds
+		self.width = width
+		# The time at which the current window started, or None until it has a sample
+		self.timeStart = None
+		# The statistics of each variable over the current window
+		self.minimums = array.array('d', [0.0] * variableCount)
+		self.maximums = array.array('d', [0.0] * variableCount)
+		self.sums = array.array('d', [0.0] * variableCount)
+		self.counts = array.array('l', [0] * variableCount)
+		# The last value of each variable, which may be text, as are parameters
+		self.lasts = [None] * variableCount
+		# The number of numeric samples of each variable, of which the minimum, maximum and mean are kept
+		self.numericCounts = array.array('l', [0] * variableCount)
+	# A method to add a sample, and return the summary of the previous window if the sample opens a new one, or None otherwise
+	def add(self, timeSample, values, validity):
+		timeStart = math.floor(timeSample / self.width) * self.width
+		summary = None
+		if (self.timeStart is not None) and (timeStart != self.timeStart):
+			summary = self.close()
+		if self.timeStart is None:
+			self.timeStart = timeStart
+		# Only valuable samples count towards the statistics
+		for index, (value, isValid) in enumerate(zip(values, validity)):
+			if not isValid:
+				continue
+			self.lasts[index] = value
+			self.counts[index] += 1
+			if isinstance(value, (int, long, float)):
+				if self.numericCounts[index] == 0:
+					self.minimums[index] = value
+					self.maximums[index] = value
+				else:
+					self.minimums[index] = min(self.minimums[index], value)
+					self.maximums[index] = max(self.maximums[index], value)
+				self.sums[index] += value
+				self.numericCounts[index] += 1
+		return summary
+	# A method to return the summary of the current window, and start afresh, or None if the window has no sample
+	def close(self):
+		if self.timeStart is None:
+			return None
+		variableCount = len(self.counts)
+		# Variables without numeric samples summarize to their last value
+		minimums = [self.minimums[index] if self.numericCounts[index] else self.lasts[index] for index in range(0, variableCount)]
+		maximums = [self.maximums[index] if self.numericCounts[index] else self.lasts[index] for index in range(0, variableCount)]
+		means = [self.sums[index] / self.numericCounts[index] if self.numericCounts[index] else self.lasts[index] for index in range(0, variableCount)]
+		summary = windowSummary(self.timeStart, self.width, minimums, maximums, means, list(self.lasts), self.counts.tolist())
+		self.timeStart = None
+		for index in range(0, variableCount):
+			self.minimums[index] = 0.0
+			self.maximums[index] = 0.0
+			self.sums[index] = 0.0
+			self.counts[index] = 0
+			self.numericCounts[index] = 0
+			self.lasts[index] = None
+		return summary
@@ -0,0 +1,138 @@
+# Hand jobs from the acquisition loop to the threads of each server
+import Queue
+# Handle threads of this process
+import threading
+# Handle sleeps, delays and timeouts
+import time
+# Count the jobs and attempts that fail
+import metrics
+
+# Number of threads that despatch to one server at once, unless the server specifies one
+concurrencyDefault = 1
+# Number of jobs that may await despatch to one server, beyond which new ones are dropped, unless the server specifies one
+limitDefault = 1000
+# Number of times to retry an attempt that failed, unless the server specifies one
+retriesDefault = 2
+# Interval to wait before the first retry, in seconds, doubling on every retry, unless the server specifies one
+backoffDefault = 1.0
+# Number of consecutive failures that open the circuit to a server, unless the server specifies one
+breakerThresholdDefault = 5
+# Interval for which an open circuit fails every attempt without making it, in seconds, unless the server specifies one
+breakerIntervalDefault = 60.0
+
+# A class to despatch the jobs of one server on threads of its own, so that a slow or dead server holds up nothing but its own jobs
+class serverQueue(object):
+	# The constructor for the serverQueue class
+	def __init__(self, serverName, server):
+		super(serverQueue, self).__init__()
+		# Space for storing the identifier of the server
+		self.serverName = serverName
+		# The limits on the threads and the jobs of the server, and the retries and backoff of each attempt
+		self.concurrency = int(server.get('concurrency', concurrencyDefault))
+		self.retries = int(server.get('retries', retriesDefault))
+		self.backoff = float(server.get('backoff', backoffDefault))
+		# The number of consecutive failures that open the circuit, and the interval for which it stays open
+		self.breakerThreshold = int(server.get('breakerThreshold', breakerThresholdDefault))
+		self.breakerInterval = float(server.get('breakerInterval', breakerIntervalDefault))
+		# The number of consecutive failures, and the time until which the circuit stays open
+		self.failures = 0
+		self.timeOpen = 0.0
+		# Flag to indicate that an attempt is on trial while the circuit is half-open
+		self.isTrial = False
+		# Lock that guards the state of the circuit
+		self.lock = threading.Lock()
+		# The jobs that await despatch, each as a function and its arguments, or None to stop a thread
+		self.jobs = Queue.Queue(int(server.get('limit', limitDefault)))
+		# Event that interrupts the backoff between retries when stopping
+		self.stopEvent = threading.Event()
+		# The threads that despatch the jobs
+		self.threads = [threading.Thread(target=self.run, name='despatch-' + serverName) for threadIndex in range(0, self.concurrency)]
+		for thread in self.threads:
+			thread.daemon = True
+			thread.start()
+	# A method to hand over a job without waiting for it, dropping it if too many await despatch
+	def submit(self, function, *arguments):
+		try:
+			self.jobs.put_nowait((function, arguments))
+		except Queue.Full:
+			print 'Despatch Queue Fail - ' + self.serverName + ' - Full'
+			metrics.registry.increment('marshal_dispatch_dropped_total', server=self.serverName)
+		metrics.registry.set('marshal_dispatch_queue_depth', self.jobs.qsize(), server=self.serverName)
+	# A method to run the jobs, one at a time, until told to stop; a job that fails must not stop the thread
+	def run(self):
+		while True:
+			job = self.jobs.get()
+			try:
+				if job is None:
+					return
+				function, arguments = job
+				try:
+					function(*arguments)
+				except Exception as error:
+					print 'Despatch Fail - ' + self.serverName + ' - ' + str(error)
+					metrics.registry.increment('marshal_dispatch_errors_total', server=self.serverName)
+			finally:
+				self.jobs.task_done()
+	# A method to check if the circuit lets an attempt through: always while closed, and just one trial once it has been open long enough
+	def isAllowed(self):
+		with self.lock:
+			if self.failures < self.breakerThreshold:
+				return True
+			if (time.time() < self.timeOpen) or self.isTrial:
+				return False
+			self.isTrial = True
+			return True
+	# A method to count the outcome of an attempt, opening the circuit once too many in a row have failed
+	def record(self, isSuccess):
+		with self.lock:
+			self.isTrial = False
+			if isSuccess:
+				self.failures = 0
+			else:
+				self.failures += 1
+				if self.failures >= self.breakerThreshold:
+					self.timeOpen = time.time() + self.breakerInterval
+			isOpen = self.failures >= self.breakerThreshold
+		metrics.registry.set('marshal_breaker_open', int(isOpen), server=self.serverName)
+	# A method to let another attempt through on trial, as when the one on trial turned out not to reach the server
+	def release(self):
+		with self.lock:
+			self.isTrial = False
+	# A method to make an attempt on the server, retrying with backoff while it fails, and return its result, or None if it failed or the circuit is open; an attempt fails if it returns None, and counts for nothing if it returns False, having had nothing to send to the server
+	def attempt(self, function, *arguments):
+		backoff = self.backoff
+		for attemptIndex in range(0, self.retries + 1):
+			if not self.isAllowed():
+				metrics.registry.increment('marshal_breaker_rejections_total', server=self.serverName)
+				return None
+			if attemptIndex > 0:
+				metrics.registry.increment('marshal_dispatch_retries_total', server=self.serverName)
+			try:
+				result = function(*arguments)
+			except Exception:
+				self.record(False)
+				raise
+			if result is False:
+				self.release()
+				return result
+			self.record(result is not None)
+			if result is not None:
+				return result
+			# Wait before the next retry, unless stopping
+			if (attemptIndex < self.retries) and self.stopEvent.wait(backoff):
+				return None
+			backoff *= 2.0
+		return None
+	# A method to wait until every job handed over so far has been despatched
+	def wait(self):
+		self.jobs.join()
+		metrics.registry.set('marshal_dispatch_queue_depth', self.jobs.qsize(), server=self.serverName)
+	# A method to despatch the jobs that remain, without retrying them, and stop the threads
+	def stop(self):
+		self.retries = 0
+		self.stopEvent.set()
+		for thread in self.threads:
+			self.jobs.put(None)
+		for thread in self.threads:
+			thread.join()
+		metrics.registry.set('marshal_dispatch_queue_depth', self.jobs.qsize(), server=self.serverName)